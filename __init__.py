@@ -1,14 +1,20 @@
 # __init__.py
 
-from aqt import mw
-from aqt.qt import QAction
-from .dialog import CustomDialog
+try:
+    from aqt import mw
+except ImportError:  # Fora do Anki (scripts, benchmarks): só o motor de análise
+    mw = None
+
+# API sem janela (ver api.py)
+from .api import build_plan, import_text, parse_text, simulate_text
 
 #def abrir_janela():
   #  dialogo = CustomDialog(parent=mw)
     #dialogo.show()
 
 def abrir_janela():
+    from .dialog import CustomDialog
+
     # Verifica se já existe uma instância do diálogo
     if hasattr(mw, 'delimitadores_dialog') and mw.delimitadores_dialog:
         # Se existe, traz para frente
@@ -22,7 +28,10 @@ def abrir_janela():
         # Armazena a referência na janela principal
         mw.delimitadores_dialog = dialogo
 
-# Add the action to the Tools menu in Anki
-acao = QAction(" 🙂 Adicionar Cards com Delimitadores", mw)
-acao.triggered.connect(abrir_janela)
-mw.form.menuTools.addAction(acao)
\ No newline at end of file
+if mw is not None:
+    from aqt.qt import QAction
+
+    # Add the action to the Tools menu in Anki
+    acao = QAction(" 🙂 Adicionar Cards com Delimitadores", mw)
+    acao.triggered.connect(abrir_janela)
+    mw.form.menuTools.addAction(acao)
\ No newline at end of file
@@ -0,0 +1,92 @@
+# __main__.py
+
+"""Linha de comando: python -m <pasta do add-on> arquivo.txt -d ";" ...
+
+Sem --colecao, só analisa o texto (precisa de --campos) e imprime os cards em
+JSON, com o tempo de análise no stderr (útil para medir sem interface). Com
+--colecao, importa para o deck e o tipo de nota informados, ou apenas simula
+com --simular. A coleção não pode estar aberta no Anki ao mesmo tempo.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .api import import_text, parse_text, simulate_text
+from .duplicates import MODE_ADD, MODES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adicionar cards com delimitadores")
+    parser.add_argument('arquivo', help="Arquivo de texto com um card por linha ('-' para a entrada padrão)")
+    parser.add_argument('-d', '--delimitador', action='append', required=True,
+                        help="Delimitador (pode repetir; use '\\t' para Tab). A ordem define a precedência")
+    parser.add_argument('--aspas', action='store_true', help="Campos entre aspas")
+    parser.add_argument('--campos', help="Nomes dos campos separados por vírgula (só para análise)")
+    parser.add_argument('--mapeamento', help="Campo de cada parte, separados por vírgula (vazio = ignorar a parte)")
+    parser.add_argument('--tags', help="Arquivo de etiquetas, uma linha por card")
+    parser.add_argument('--numerar-tags', action='store_true')
+    parser.add_argument('--colecao', help="Arquivo collection.anki2")
+    parser.add_argument('--deck')
+    parser.add_argument('--modelo', help="Tipo de nota")
+    parser.add_argument('--duplicatas', choices=MODES, default=MODE_ADD)
+    parser.add_argument('--simular', action='store_true', help="Não grava nada, só mostra o relatório")
+    args = parser.parse_args(argv)
+
+    delimitadores = [d.replace('\\t', '\t') for d in args.delimitador]
+    if args.arquivo == '-':
+        texto = sys.stdin.read()
+    else:
+        with open(args.arquivo, 'r', encoding='utf-8') as f:
+            texto = f.read()
+    tags = None
+    if args.tags:
+        with open(args.tags, 'r', encoding='utf-8') as f:
+            tags = f.read()
+    mapeamento = args.mapeamento.split(',') if args.mapeamento else None
+
+    if not args.colecao:
+        if not args.campos:
+            parser.error("sem --colecao, informe --campos")
+        inicio = time.perf_counter()
+        cards = parse_text(texto, delimitadores, args.campos.split(','), mapeamento, tags, args.aspas,
+                           args.numerar_tags)
+        decorrido = time.perf_counter() - inicio
+        json.dump(cards, sys.stdout, ensure_ascii=False, indent=2)
+        print(f"\n{len(cards)} cards analisados em {decorrido * 1000:.1f} ms", file=sys.stderr)
+        return 0
+
+    if not args.modelo or (not args.deck and not args.simular):
+        parser.error("com --colecao, informe --modelo e --deck")
+    from anki.collection import Collection
+    col = Collection(args.colecao)
+    try:
+        if args.simular:
+            relatorio = simulate_text(col, texto, args.modelo, delimitadores, mapeamento, tags, args.aspas,
+                                      args.numerar_tags, duplicates=args.duplicatas)
+            print(f"Notas que seriam criadas: {relatorio.would_add}")
+            print(f"Notas que seriam atualizadas: {relatorio.would_update}")
+            print(f"Linhas sem delimitador ativo: {len(relatorio.skipped_lines)}")
+            print(f"Linhas com número de campos diferente: {len(relatorio.field_mismatches)}")
+            print(f"Mídias não encontradas: {len(relatorio.missing_media)}")
+            print(f"Duplicatas: {len(relatorio.duplicates)}")
+            for etapa, segundos in relatorio.timings.items():
+                print(f"  {etapa}: {segundos * 1000:.1f} ms")
+            return 0
+        inicio = time.perf_counter()
+        resultado = import_text(col, texto, args.deck, args.modelo, delimitadores, mapeamento, tags, args.aspas,
+                                args.numerar_tags, duplicates=args.duplicatas)
+        decorrido = time.perf_counter() - inicio
+        print(f"Cards adicionados: {resultado.added} em {decorrido:.1f} s")
+        if resultado.updated:
+            print(f"Notas atualizadas: {resultado.updated}")
+        for numero, erro in resultado.failures:
+            print(f"Linha {numero + 1}: {erro}", file=sys.stderr)
+        return 1 if resultado.failures else 0
+    finally:
+        col.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
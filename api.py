@@ -0,0 +1,117 @@
+# api.py
+
+"""API para scripts, sem janela: análise e importação de texto com delimitadores.
+
+Pode ser usada no console de depuração do Anki, em tarefas agendadas de
+outros add-ons ou fora do Anki (com o pacote `anki` do pip). Tudo recebe a
+coleção diretamente, então também funciona com uma coleção substituta em
+testes. A coleção precisa oferecer `models.by_name`, `decks.by_name`,
+`new_note`, `add_note`/`add_notes` e `media.dir()` (a simulação procura as
+mídias lá), além de `db.execute`/`db.list`, `get_note` e
+`update_note`/`update_notes` para as duplicatas e o registro de linhas já
+importadas. Ver tests/test_api.py.
+
+Exemplo (console de depuração):
+
+    from delimitadores import import_text  # nome da pasta do add-on
+    resultado = import_text(mw.col, "gato;cat\\ncão;dog", "Inglês", "Básico", [";"])
+    print(resultado.added, resultado.failures)
+"""
+
+from .card_parser import compile_tokenizer
+from .duplicates import MODE_ADD
+from .import_plan import ImportPlan
+from .importer import CHUNK_SIZE, import_cards, simulate_import
+from .ledger import ImportLedger
+
+
+def split_lines(text):
+    """Linhas do texto, como no campo de entrada do diálogo."""
+    return text.strip().replace('\r\n', '\n').split('\n')
+
+
+def _tag_lines(tags, total):
+    """Etiquetas por linha: texto único para todas, texto com uma linha por card ou lista."""
+    if not tags:
+        return ()
+    if isinstance(tags, str):
+        linhas_tags = split_lines(tags)
+        # Uma única linha de etiquetas vale para todos os cards
+        return linhas_tags * total if len(linhas_tags) == 1 else linhas_tags
+    return list(tags)
+
+
+def _mapping(mapping):
+    """Aceita o formato do diálogo ({"0": "Frente"}) ou a lista de campos na ordem das partes."""
+    if mapping is None or isinstance(mapping, dict):
+        return mapping
+    return {str(i): nome for i, nome in enumerate(mapping) if nome}
+
+
+def build_plan(col, notetype, delimiters, mapping=None, deck=None, field_images=None, numerar_tags=False,
+               quoted=False):
+    """ImportPlan para o tipo de nota e o deck informados (por nome ou já carregados)."""
+    modelo = col.models.by_name(notetype) if isinstance(notetype, str) else notetype
+    if not modelo:
+        raise ValueError(f"Tipo de nota não encontrado: {notetype}")
+    deck_id = None
+    if isinstance(deck, str):
+        encontrado = col.decks.by_name(deck)
+        if not encontrado:
+            raise ValueError(f"Deck não encontrado: {deck}")
+        deck_id = encontrado['id']
+    elif deck is not None:
+        deck_id = int(deck)
+    tokenizer = compile_tokenizer(tuple(delimiters), quoted)
+    return ImportPlan.from_notetype(tokenizer, modelo, _mapping(mapping), field_images, numerar_tags, deck_id)
+
+
+def parse_text(text, delimiters, fields, mapping=None, tags=None, quoted=False, numerar_tags=False):
+    """Analisa o texto sem coleção e retorna um dicionário por card válido.
+
+    `fields` é a lista de nomes dos campos do tipo de nota. Cada card vem como
+    {"line": número da linha (a partir de 0), "fields": {campo: conteúdo},
+    "tags": [etiquetas]}.
+    """
+    plan = ImportPlan(compile_tokenizer(tuple(delimiters), quoted), fields, _mapping(mapping),
+                      numerar_tags=numerar_tags)
+    linhas = split_lines(text)
+    cards = []
+    for card in plan.parse(linhas, _tag_lines(tags, len(linhas))):
+        cards.append({
+            'line': card.line_number,
+            'fields': {plan.campos[i]: conteudo for i, conteudo in plan.field_values(card, linhas[card.line_number])},
+            'tags': plan.card_tags(card),
+        })
+    return cards
+
+
+def import_text(col, text, deck, notetype, delimiters, mapping=None, tags=None, quoted=False,
+                numerar_tags=False, field_images=None, duplicates=MODE_ADD, ledger_path=None, draft_id=None,
+                chunk_size=CHUNK_SIZE, progress=None, should_cancel=None):
+    """Importa o texto para a coleção e retorna um importer.ImportResult.
+
+    `deck` e `notetype` podem ser nomes ou o id do deck e o tipo de nota já
+    carregado. Com `ledger_path` e `draft_id`, as linhas já importadas antes
+    são puladas (ver ledger.py).
+    """
+    if ledger_path is not None and not draft_id:
+        raise ValueError("Informe o draft_id para usar o registro de importação")
+    plan = build_plan(col, notetype, delimiters, mapping, deck, field_images, numerar_tags, quoted)
+    if plan.deck_id is None:
+        raise ValueError("Informe o deck de destino")
+    linhas = split_lines(text)
+    linhas_tags = _tag_lines(tags, len(linhas))
+    if ledger_path is None:
+        return import_cards(col, plan, linhas, linhas_tags, chunk_size, progress, should_cancel, duplicates)
+    with ImportLedger(ledger_path) as ledger:
+        return import_cards(col, plan, linhas, linhas_tags, chunk_size, progress, should_cancel, duplicates,
+                            ledger, draft_id)
+
+
+def simulate_text(col, text, notetype, delimiters, mapping=None, tags=None, quoted=False, numerar_tags=False,
+                  field_images=None, duplicates=MODE_ADD):
+    """Como import_text, mas sem gravar: retorna o importer.DryRunReport."""
+    plan = build_plan(col, notetype, delimiters, mapping, None, field_images, numerar_tags, quoted)
+    linhas = split_lines(text)
+    return simulate_import(col, plan, linhas, _tag_lines(tags, len(linhas)), duplicates)
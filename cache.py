@@ -0,0 +1,78 @@
+# cache.py
+
+"""Cache LRU limitado por tamanho, com estatísticas de acerto (sem aqt).
+
+O tamanho de cada valor é medido por `sizeof` (por padrão len(), ou seja,
+caracteres de uma string ou bytes de um bytes) e as entradas menos usadas
+recentemente são descartadas quando a soma passa de `max_size`.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()  # Chave -> (valor, tamanho)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __contains__(self, chave):
+        return chave in self._entradas
+
+    def get(self, chave, padrao=None):
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            self.misses += 1
+            return padrao
+        self._entradas.move_to_end(chave)
+        self.hits += 1
+        return entrada[0]
+
+    def put(self, chave, valor):
+        tamanho = self.sizeof(valor)
+        anterior = self._entradas.pop(chave, None)
+        if anterior is not None:
+            self.size -= anterior[1]
+        if tamanho > self.max_size:
+            # Maior que o cache inteiro: não guarda
+            return valor
+        self._entradas[chave] = (valor, tamanho)
+        self.size += tamanho
+        while self.size > self.max_size:
+            _, (_, removido) = self._entradas.popitem(last=False)
+            self.size -= removido
+        return valor
+
+    def pop(self, chave):
+        entrada = self._entradas.pop(chave, None)
+        if entrada is None:
+            return None
+        self.size -= entrada[1]
+        return entrada[0]
+
+    def discard_where(self, condicao):
+        """Remove as entradas em que condicao(chave, valor) é verdadeira; retorna as chaves removidas."""
+        removidas = [chave for chave, (valor, _) in self._entradas.items() if condicao(chave, valor)]
+        for chave in removidas:
+            self.pop(chave)
+        return removidas
+
+    def clear(self):
+        self._entradas.clear()
+        self.size = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Resumo legível: entradas, tamanho e taxa de acerto."""
+        return (f"{len(self)} entradas, {self.size / 1024:.0f} de {self.max_size / 1024:.0f} KB, "
+                f"acertos {self.hit_rate:.0%} ({self.hits}/{self.hits + self.misses})")
@@ -0,0 +1,299 @@
+# card_parser.py
+
+"""Motor de análise dos cards, sem dependência do aqt.
+
+Recebe as linhas digitadas, os delimitadores ativos, os campos do tipo de nota,
+o mapeamento de partes para campos e as etiquetas, e devolve os cards
+analisados de forma preguiçosa (gerador). É usado pelo diálogo principal
+(adicionar cards e pré-visualização) e pelo VisualizarCards.
+"""
+
+import csv
+import re
+import threading
+from functools import lru_cache
+
+# Entidade HTML (&nbsp;, &#233;, &#xE9;) cortada logo antes do ";" final
+_ENTIDADE_ABERTA = re.compile(r'&(?:[A-Za-z][A-Za-z0-9]*|#[0-9]+|#[xX][0-9A-Fa-f]+)$')
+_ENTIDADE = re.compile(r'&(?:[A-Za-z][A-Za-z0-9]*|#[0-9]+|#[xX][0-9A-Fa-f]+);')
+# Trecho entre aspas que não é valor de atributo HTML (src="...")
+_ENTRE_ASPAS = re.compile(r'(?<!=)"(?:[^"\\]+|""|\\.)*"')
+# Arquivo citado em <img src="...">, <source src="..."> ou <video src="...">
+_MEDIA_SRC = re.compile(r'<(?:img|source|video)\s+src="([^"]+)"')
+
+
+def parse_tags(linha_tags):
+    """Divide uma linha de etiquetas separadas por vírgula."""
+    return [tag.strip() for tag in linha_tags.split(',') if tag.strip()]
+
+
+def format_tags(tags, card_index, numerar=False):
+    """Aplica a numeração (opcional) às etiquetas de um card."""
+    if numerar:
+        # Remove números antigos antes de numerar de novo
+        return [f"{tag.rstrip('0123456789')}{card_index + 1}" for tag in tags]
+    return list(tags)
+
+
+def _rejoin_entities(partes, delim):
+    """Junta de volta as partes cortadas no ";" de uma entidade HTML."""
+    resultado = [partes[0]]
+    for parte in partes[1:]:
+        if '&' in resultado[-1] and _ENTIDADE_ABERTA.search(resultado[-1]):
+            resultado[-1] += delim + parte
+        else:
+            resultado.append(parte)
+    return resultado
+
+
+def split_quoted(linha, delim):
+    """Máquina de estados para campos entre aspas com qualquer delimitador.
+
+    Aspas só abrem um campo no início dele (como no csv), "" vira uma aspa,
+    a barra invertida escapa apenas o delimitador, a aspa e ela mesma (para
+    não estragar MathJax como \\(x\\)) e entidades HTML nunca são cortadas.
+    """
+    partes = []
+    atual = []
+    n = len(linha)
+    tam = len(delim)
+    i = 0
+    inicio_campo = True
+    entre_aspas = False
+    while i < n:
+        c = linha[i]
+        if c == '\\' and i + 1 < n and (linha[i + 1] in '"\\' or linha.startswith(delim, i + 1)):
+            escapado = delim if linha.startswith(delim, i + 1) else linha[i + 1]
+            atual.append(escapado)
+            i += 1 + len(escapado)
+            inicio_campo = False
+            continue
+        if entre_aspas:
+            if c == '"':
+                if linha.startswith('"', i + 1):
+                    atual.append('"')
+                    i += 2
+                    continue
+                entre_aspas = False
+            else:
+                atual.append(c)
+            i += 1
+            continue
+        if inicio_campo and c == '"':
+            entre_aspas = True
+            inicio_campo = False
+            atual.clear()  # Descarta espaços antes da aspa de abertura
+            i += 1
+            continue
+        if linha.startswith(delim, i):
+            partes.append(''.join(atual))
+            atual = []
+            inicio_campo = True
+            i += tam
+            continue
+        if c == '&':
+            m = _ENTIDADE.match(linha, i)
+            if m:
+                atual.append(m.group())
+                i = m.end()
+                inicio_campo = False
+                continue
+        if not c.isspace():
+            inicio_campo = False
+        atual.append(c)
+        i += 1
+    partes.append(''.join(atual))
+    return partes
+
+
+class Tokenizer:
+    """Divide linhas pelos delimitadores ativos, montado uma vez por seleção.
+
+    Regra de precedência: quando a linha contém mais de um delimitador ativo,
+    vale o que vem primeiro na ordem da seleção (a mesma das caixas de
+    seleção), nunca o que aparece primeiro na linha.
+
+    Com quoted=True os campos podem vir entre aspas duplas e conter o próprio
+    delimitador; nesse modo, um delimitador que só aparece dentro de aspas ou
+    de entidades HTML é ignorado e passa a valer o próximo da ordem.
+    """
+
+    def __init__(self, delimitadores, quoted=False):
+        # Remove vazios e repetidos mantendo a ordem de precedência
+        self.delimitadores = tuple(dict.fromkeys(d for d in delimitadores if d))
+        self.quoted = quoted
+        if quoted:
+            self.split_delim = self._split_quoted
+        elif len(self.delimitadores) == 1:
+            self.split_delim = self._split_unico
+
+    def split_delim(self, linha):
+        """Retorna (partes, delimitador) ou None se não houver delimitador.
+
+        O delimitador vem como None quando as partes não são fatias literais
+        da linha (aspas removidas ou escapes resolvidos).
+        """
+        for delim in self.delimitadores:
+            if delim in linha:
+                return linha.split(delim), delim
+        return None
+
+    def _split_unico(self, linha):
+        delim = self.delimitadores[0]
+        return (linha.split(delim), delim) if delim in linha else None
+
+    def _split_quoted(self, linha):
+        # Linhas sem aspas nem barras (a maioria) ficam no str.split em C
+        simples = '"' not in linha and '\\' not in linha
+        if simples:
+            visivel = linha
+        elif '\\' in linha or linha.count('"') % 2:
+            visivel = _ENTRE_ASPAS.sub('', linha)
+        else:
+            # Aspas balanceadas: os trechos ímpares ficam entre aspas
+            visivel = ''.join(linha.split('"')[::2])
+        if '&' in visivel:
+            visivel = _ENTIDADE.sub('', visivel)
+        for delim in self.delimitadores:
+            if delim in visivel:
+                break
+        else:
+            return None
+        if simples:
+            partes = linha.split(delim)
+            return (_rejoin_entities(partes, delim) if '&' in linha else partes), delim
+        if len(delim) == 1 and '\\' not in linha and not linha.count('"') % 2:
+            # Leitor csv em C (aspas balanceadas); as aspas só valem no início do campo.
+            # Um leitor por chamada: o Tokenizer é compartilhado entre threads
+            # (compile_tokenizer) e não guarda estado da linha.
+            partes = next(csv.reader((linha,), delimiter=delim, quotechar='"', doublequote=True,
+                                     skipinitialspace=True))
+            return (_rejoin_entities(partes, delim) if '&' in linha else partes), None
+        return split_quoted(linha, delim), None
+
+
+@lru_cache(maxsize=16)
+def compile_tokenizer(delimitadores, quoted=False):
+    """Tokenizer em cache para uma tupla de delimitadores."""
+    return Tokenizer(delimitadores, quoted)
+
+
+class TagTable:
+    """Tabela de etiquetas: cada texto distinto vira um número inteiro.
+
+    Cada CardParser tem a sua, descartada junto com o plano. O mesmo plano
+    é usado pela importação (thread da operação) e pelo visualizador (thread
+    principal), então a criação de um número novo é feita sob trava.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._tuplas = {}  # Cards com as mesmas etiquetas dividem a mesma tupla
+        self._trava = threading.Lock()
+        self.names = []
+
+    def ids(self, tags):
+        resultado = []
+        for tag in tags:
+            tag_id = self._ids.get(tag)
+            if tag_id is None:
+                with self._trava:
+                    tag_id = self._ids.get(tag)  # Outra thread pode ter criado
+                    if tag_id is None:
+                        self.names.append(tag)
+                        tag_id = self._ids[tag] = len(self.names) - 1
+            resultado.append(tag_id)
+        resultado = tuple(resultado)
+        return self._tuplas.setdefault(resultado, resultado)
+
+
+class ParsedCard:
+    """Registro compacto de um card analisado.
+
+    Não guarda o texto dos campos: `spans` tem, para cada campo mapeado, o
+    trio (índice do campo no modelo, início, fim) como deslocamentos na linha
+    de origem, já sem os espaços das pontas. Só linhas com aspas ou escapes
+    (modo "campos entre aspas") guardam os valores em `valores`. O conteúdo
+    final e o HTML são gerados sob demanda pelo ImportPlan.
+    """
+
+    __slots__ = ('line_number', 'card_index', 'spans', 'valores', 'tag_ids', 'media', 'part_count')
+
+    def __init__(self, line_number, card_index, spans, valores=None, tag_ids=(), media=(), part_count=0):
+        self.line_number = line_number  # Linha no texto de entrada
+        self.card_index = card_index  # Posição entre os cards válidos
+        self.spans = spans  # Tupla plana: campo, início, fim, campo, início, fim...
+        self.valores = valores  # Conteúdo dos campos quando não é fatia da linha
+        self.tag_ids = tag_ids  # Índices na tag_table do parser (etiquetas sem numeração)
+        self.media = media  # Arquivos de mídia citados na linha
+        self.part_count = part_count  # Partes encontradas na linha (mapeadas ou não)
+
+
+class CardParser:
+    def __init__(self, delimitadores, campos, field_mappings=None):
+        # Aceita um Tokenizer já compilado ou a lista de delimitadores
+        self.tokenizer = delimitadores if isinstance(delimitadores, Tokenizer) else compile_tokenizer(tuple(delimitadores))
+        self.split_delim = self.tokenizer.split_delim
+        self.campos = list(campos)
+        self.tag_table = TagTable()
+
+        # Resolve uma única vez: índice da parte -> índice do campo no modelo
+        # (-1 para partes sem campo), numa lista consultada por posição
+        indices = {nome: i for i, nome in enumerate(self.campos)}
+        if field_mappings:
+            mapa = {int(parte): indices[nome] for parte, nome in field_mappings.items() if nome in indices}
+            self.destinos = [mapa.get(i, -1) for i in range(max(mapa, default=-1) + 1)]
+        else:
+            # Sem mapeamento: ordem padrão dos campos
+            self.destinos = list(range(len(self.campos)))
+        # Quantas partes por linha o mapeamento espera
+        self.expected_parts = len(self.destinos)
+
+    def parse_line(self, linha, line_number=0, card_index=0, linha_tags=''):
+        """Analisa uma única linha. Retorna None se ela não formar um card."""
+        if not linha.strip():
+            return None
+        resultado = self.split_delim(linha)
+        if resultado is None:
+            return None
+        partes, delim = resultado
+
+        destinos = self.destinos
+        total = len(destinos)
+        spans = []
+        valores = None
+        if delim is not None:
+            passo = len(delim)
+            inicio = 0
+            for i, parte in enumerate(partes):
+                fim = inicio + len(parte)
+                campo_idx = destinos[i] if i < total else -1
+                if campo_idx >= 0:
+                    # Desconta os espaços das pontas sem copiar o texto
+                    sem_esquerda = len(parte) - len(parte.lstrip())
+                    sem_direita = len(parte) - len(parte.rstrip()) if sem_esquerda < len(parte) else 0
+                    spans += (campo_idx, inicio + sem_esquerda, fim - sem_direita)
+                inicio = fim + passo
+        else:
+            valores = []
+            for i, parte in enumerate(partes):
+                campo_idx = destinos[i] if i < total else -1
+                if campo_idx >= 0:
+                    spans += (campo_idx, 0, 0)
+                    valores.append(parte.strip())
+            valores = tuple(valores)
+
+        tag_ids = self.tag_table.ids(parse_tags(linha_tags)) if linha_tags else ()
+        media = tuple(_MEDIA_SRC.findall(linha)) if 'src=' in linha else ()
+        return ParsedCard(line_number, card_index, tuple(spans), valores, tag_ids, media, len(partes))
+
+    def parse(self, linhas, linhas_tags=()):
+        """Gera os cards de todas as linhas, numerando apenas as linhas válidas."""
+        card_index = 0
+        for i, linha in enumerate(linhas):
+            linha_tags = linhas_tags[i] if i < len(linhas_tags) else ''
+            card = self.parse_line(linha, i, card_index, linha_tags)
+            if card is None:
+                continue
+            yield card
+            card_index += 1
@@ -5,23 +5,145 @@ import os
 import shutil
 import re
 import urllib.parse
-import base64
 import logging
+import threading
+import time
 from PyQt6.QtCore import QTimer
 from aqt import mw
 from aqt.qt import *
-from aqt.utils import showInfo, showWarning
+from aqt.utils import showInfo, showWarning, showText
+from aqt.operations import CollectionOp, QueryOp
+from anki.collection import OpChanges
 from aqt.webview import QWebEngineView
 from anki.utils import strip_html
-from .highlighter import HtmlTagHighlighter
+from .highlighter import LAZY_BLOCKS, HtmlTagHighlighter
+from .document import SnapshotSource
+from .search import SearchIndex, compile_query
 from .media_manager import MediaManagerDialog
 from .visualizar import VisualizarCards
-from .utils import CONFIG_FILE
+from .utils import CONFIG_FILE, LEDGER_FILE
+from .card_parser import compile_tokenizer
+from .import_plan import ImportPlan
+from .cache import LRUCache
+from .line_cache import LineCache
+from .preview import PreviewScheduler
+from .render import card_fields
+from .media_cache import link_media, media_encoder, mime_type
+from .thumbnails import pending_marker, thumbnail_cache, thumbnail_media
+from .importer import import_cards, simulate_import
+from .ledger import ImportLedger, new_draft_id
+from .duplicates import DUP_COLLECTION, MODE_ADD, MODE_SKIP, MODE_TAG, MODE_UPDATE, DUPLICATE_TAG
 
 # Configuração de logging
 logging.basicConfig(filename="delimitadores.log", level=logging.DEBUG)
 
+# Página da pré-visualização: carregada uma vez; cada atualização só chama
+# patchCard() com os campos do card da linha atual (ver show_preview)
+PREVIEW_PAGE = """
+<html><body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 10px;">
+<style>
+    table {
+        border-collapse: collapse;
+        width: 100%;
+        margin: 5px 0;
+    }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 8px;
+        text-align: left;
+        vertical-align: top;
+        width: 33%;
+        box-sizing: border-box;
+    }
+    th {
+        background-color: #f2f2f2;
+        font-weight: bold;
+    }
+    ul, ol {
+        margin: 5px 0;
+        padding-left: 20px;
+    }
+    /* Mesmo visual da tabela de render.card_table_html */
+    table.card {
+        width: 100%; border-collapse: separate; border-spacing: 0; margin: 0 0 20px 0;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.1); border-radius: 8px;
+    }
+    table.card > tbody > tr > td.campo-nome {
+        width: auto; background-color: #444; color: white; padding: 12px; text-align: center;
+        font-weight: bold; font-size: 16px; border: none; border-top-left-radius: 8px; border-top-right-radius: 8px;
+    }
+    table.card > tbody > tr > td.campo-valor {
+        width: auto; padding: 15px; border: 1px solid #ddd; background-color: white;
+        border-bottom-left-radius: 8px; border-bottom-right-radius: 8px;
+    }
+</style>
+<div id="card"></div>
+<script>
+// Atualiza só as células que mudaram: mídias tocando em outros campos e a
+// rolagem da página não são reiniciadas
+function patchCard(dados) {
+    var raiz = document.getElementById('card');
+    if (!dados) {
+        raiz.innerHTML = '';
+        return;
+    }
+    var tabela = raiz.querySelector('table.card');
+    if (!tabela) {
+        raiz.innerHTML = '<table class="card"></table><p class="tags"></p>';
+        tabela = raiz.querySelector('table.card');
+    }
+    dados.campos.forEach(function (campo, i) {
+        var nome = tabela.rows[2 * i];
+        if (!nome) {
+            nome = tabela.insertRow();
+            nome.insertCell().className = 'campo-nome';
+            tabela.insertRow().insertCell().className = 'campo-valor';
+        }
+        var celulaNome = nome.cells[0];
+        var celulaValor = tabela.rows[2 * i + 1].cells[0];
+        if (celulaNome.textContent !== campo[0]) celulaNome.textContent = campo[0];
+        // Compara com o HTML enviado antes (o innerHTML volta normalizado)
+        if (celulaValor.dataset.html !== campo[1]) {
+            celulaValor.innerHTML = campo[1];
+            celulaValor.dataset.html = campo[1];
+        }
+    });
+    while (tabela.rows.length > 2 * dados.campos.length) tabela.deleteRow(-1);
+    var tags = raiz.querySelector('p.tags');
+    var htmlTags = dados.tags.length ? '<b>Tags:</b> ' + dados.tags.join(', ') : '';
+    if (tags.dataset.html !== htmlTags) {
+        tags.innerHTML = htmlTags;
+        tags.dataset.html = htmlTags;
+    }
+}
+</script>
+</body></html>
+"""
+
+# Limite do cache de HTML da pré-visualização, em caracteres
+PREVIEW_CACHE_SIZE = 8 * 1024 * 1024
+
+# Rascunhos maiores que isto (caracteres) são carregados aos poucos (ver load_text)
+LARGE_DRAFT_CHARS = 1024 * 1024
+LOAD_CHUNK_CHARS = 256 * 1024
+
+# Ocorrências que começam até esta distância antes da área visível ainda são destacadas
+MAX_MATCH_SCAN = 1000
+
+# Opções do combo "Duplicatas" (modo, texto exibido)
+DUPLICATE_OPTIONS = [
+    (MODE_ADD, "Adicionar mesmo assim"),
+    (MODE_SKIP, "Ignorar duplicatas"),
+    (MODE_UPDATE, "Atualizar nota existente"),
+    (MODE_TAG, f"Adicionar com etiqueta '{DUPLICATE_TAG}'"),
+]
+
 class CustomDialog(QDialog):
+    # Linhas do rascunho alteradas: (primeira linha, linhas removidas, linhas inseridas)
+    lines_changed = pyqtSignal(int, int, int)
+    # Opções que mudam o resultado de todas as linhas (ver invalidate_plan)
+    plan_changed = pyqtSignal()
+
     def __init__(self, parent=None):
         if not mw:
             showWarning("A janela principal do Anki não está disponível!")
@@ -33,8 +155,8 @@ class CustomDialog(QDialog):
         self.media_dialog = None  # Adicione esta linha
 
         self.visualizar_dialog = None
-        self.last_search_query = ""
-        self.last_search_position = 0
+        self.search_index = None  # Ocorrências da pesquisa atual (ver find_match)
+        self._search_pending = None  # Chave do índice sendo montado em segundo plano
         self.zoom_factor = 1.0
         self.cloze_2_count = 1
         self.initial_tags_set = False
@@ -49,8 +171,23 @@ class CustomDialog(QDialog):
         self.is_dark_theme = False
         self.field_mappings = {}  # Mapeamento de índices para campos
         self.field_images = {}  # Imagens associadas a cada campo
+        self.tokenizer = None  # Recompilado quando a seleção de delimitadores muda
+        self._plan = None  # ImportPlan das opções atuais (ver current_plan)
+        self.plan_version = 0  # Muda a cada mudança de opções (entra na chave do cache)
+        self.preview_cache = LRUCache(PREVIEW_CACHE_SIZE)  # HTML da pré-visualização por conteúdo
+        self.line_cache = LineCache()  # Card analisado por linha do editor (ver line_cache.py)
+        self.lines_changed.connect(self.line_cache.invalidate)
+        # Junta os pedidos de pré-visualização de uma mesma volta do laço de eventos
+        self.preview_scheduler = PreviewScheduler(self.render_preview, lambda: self.txt_entrada.document().blockCount(), self)
+        self._preview_key = None  # Chave do que está na pré-visualização agora
+        self._preview_loaded = False  # PREVIEW_PAGE já foi enviada ao preview_widget
+        self._preview_ready = False  # ... e terminou de carregar (patchCard disponível)
+        self._preview_pending = None  # Atualização à espera do fim do carregamento
+        self.import_running = False  # Importação em segundo plano em andamento
+        self.draft_id = new_draft_id()  # Identifica o rascunho no registro de importação
         self.setup_ui()
         self.load_settings()
+        thumbnail_cache().ready.connect(self.on_thumbnail_ready)
 
     def setup_ui(self):
         self.setWindowTitle("Adicionar Cards com Delimitadores")
@@ -131,13 +268,24 @@ class CustomDialog(QDialog):
 
 
 
-        self.txt_entrada = QTextEdit()
+        # Só texto: o layout por blocos do QPlainTextEdit aguenta rascunhos grandes
+        self.txt_entrada = QPlainTextEdit()
         self.txt_entrada.setUndoRedoEnabled(True)  # Suporte a undo/redo
         self.txt_entrada.setPlaceholderText("Digite seus cards aqui...")
-        self.highlighter = HtmlTagHighlighter(self.txt_entrada.document())
+        self.highlighter = HtmlTagHighlighter(self.txt_entrada.document(), self.visible_line_range)
+        # Texto do rascunho compartilhado por revisão (ver document.py); o destaque
+        # em segundo plano só muda a formatação
+        self.draft_text = SnapshotSource(self.txt_entrada.document(),
+                                         lambda removed, added: self.highlighter.background and removed == added)
         self.txt_entrada.textChanged.connect(self.schedule_save)  # Debounce
         self.txt_entrada.textChanged.connect(self.update_tags_lines)
         self.txt_entrada.cursorPositionChanged.connect(self.check_line_change)
+        self._block_count = self.txt_entrada.document().blockCount()
+        self._syncing_tags = False  # mirror_tag_lines em andamento
+        self.loading_text = False  # load_text em andamento
+        self.txt_entrada.document().contentsChange.connect(self.on_contents_change)
+        self.txt_entrada.textChanged.connect(self.clear_search)  # O índice da pesquisa ficou velho
+        self.txt_entrada.verticalScrollBar().valueChanged.connect(self.highlight_matches)
         self.txt_entrada.installEventFilter(self)
         cards_layout.addWidget(self.txt_entrada)
 
@@ -152,11 +300,13 @@ class CustomDialog(QDialog):
         etiquetas_header_layout.addStretch()
         etiquetas_layout.addLayout(etiquetas_header_layout)
         self.txt_tags = QTextEdit()
+        self.tags_text = SnapshotSource(self.txt_tags.document())
         self.txt_tags.setUndoRedoEnabled(True)  # Suporte a undo/redo
         self.txt_tags.setPlaceholderText("Digite as etiquetas aqui (uma linha por card)...")
         self.txt_tags.setMaximumWidth(200)
         self.txt_tags.textChanged.connect(self.schedule_save)  # Debounce
         self.txt_tags.textChanged.connect(self.update_preview)
+        self.txt_tags.document().contentsChange.connect(self.on_tags_change)
         self.txt_tags.installEventFilter(self)
         etiquetas_layout.addWidget(self.txt_tags)
         self.etiquetas_group.setVisible(False)
@@ -173,6 +323,7 @@ class CustomDialog(QDialog):
             settings.setAttribute(attr, True)
         settings.setAttribute(QWebEngineSettings.WebAttribute.PlaybackRequiresUserGesture, False)
         self.preview_widget.setMinimumWidth(300)
+        self.preview_widget.loadFinished.connect(self.on_preview_loaded)
         self.fields_splitter.addWidget(self.preview_widget)
 
         self.fields_splitter.setSizes([700, 300])
@@ -183,6 +334,7 @@ class CustomDialog(QDialog):
         options_layout.addStretch()
         self.chk_num_tags = QCheckBox("Numerar Tags")
         self.chk_repetir_tags = QCheckBox("Repetir Tags")
+        self.chk_num_tags.stateChanged.connect(self.invalidate_plan)
         self.chk_num_tags.stateChanged.connect(self.update_tag_numbers)
         self.chk_num_tags.stateChanged.connect(self.schedule_save)  # Debounce
         self.chk_repetir_tags.stateChanged.connect(self.update_repeated_tags)
@@ -190,6 +342,21 @@ class CustomDialog(QDialog):
         options_layout.addWidget(self.chk_num_tags)
         options_layout.addWidget(self.chk_repetir_tags)
 
+        # Tratamento de notas cujo primeiro campo já existe
+        options_layout.addWidget(QLabel("Duplicatas:"))
+        self.cmb_duplicatas = QComboBox()
+        for modo, texto in DUPLICATE_OPTIONS:
+            self.cmb_duplicatas.addItem(texto, modo)
+        self.cmb_duplicatas.setToolTip("Compara o primeiro campo com as notas do modelo e com as outras linhas")
+        self.cmb_duplicatas.currentIndexChanged.connect(self.schedule_save)  # Debounce
+        options_layout.addWidget(self.cmb_duplicatas)
+
+        self.chk_pular_importadas = QCheckBox("Pular linhas já importadas")
+        self.chk_pular_importadas.setChecked(True)
+        self.chk_pular_importadas.setToolTip("Retoma importações interrompidas e importa de novo só as linhas alteradas")
+        self.chk_pular_importadas.stateChanged.connect(self.schedule_save)  # Debounce
+        options_layout.addWidget(self.chk_pular_importadas)
+
         self.toggle_tags_button = QPushButton("Mostrar Etiquetas", self)
         self.toggle_tags_button.clicked.connect(self.toggle_tags)
         options_layout.addWidget(self.toggle_tags_button)
@@ -237,9 +404,25 @@ class CustomDialog(QDialog):
         self.search_input = QLineEdit(self)
         self.search_input.setPlaceholderText("Pesquisar... Ctrl+P")
         search_layout.addWidget(self.search_input)
+        self.search_input.textChanged.connect(self.clear_search)
+        self.search_input.returnPressed.connect(self.search_text)
+        self.chk_busca_regex = QCheckBox("Regex", self)
+        self.chk_busca_regex.setToolTip("Pesquisar com expressão regular")
+        self.chk_busca_regex.stateChanged.connect(self.clear_search)
+        search_layout.addWidget(self.chk_busca_regex)
+        self.chk_busca_palavra = QCheckBox("Palavra inteira", self)
+        self.chk_busca_palavra.stateChanged.connect(self.clear_search)
+        search_layout.addWidget(self.chk_busca_palavra)
+        search_previous_button = QPushButton("◀", self)
+        search_previous_button.setToolTip("Ocorrência anterior (Ctrl+Shift+P)")
+        search_previous_button.clicked.connect(self.search_previous)
+        search_layout.addWidget(search_previous_button)
         search_button = QPushButton("Pesquisar", self)
+        search_button.setToolTip("Próxima ocorrência (Ctrl+P)")
         search_button.clicked.connect(self.search_text)
         search_layout.addWidget(search_button)
+        self.search_count_label = QLabel("", self)  # "n de m"
+        search_layout.addWidget(self.search_count_label)
         self.replace_input = QLineEdit(self)
         self.replace_input.setPlaceholderText("Substituir tudo por... Ctrl+Shift+R")
         search_layout.addWidget(self.replace_input)
@@ -281,6 +464,7 @@ class CustomDialog(QDialog):
         decks_group = QGroupBox("Decks")
         decks_layout = QVBoxLayout(decks_group)
         self.scroll_decks, self.lista_decks = self.criar_lista_rolavel([d.name for d in mw.col.decks.all_names_and_ids()], 100)
+        self.lista_decks.currentItemChanged.connect(self.invalidate_plan)
         self.lista_decks.currentItemChanged.connect(self.schedule_save)  # Debounce
         decks_layout.addWidget(self.scroll_decks)
         self.decks_search_input = QLineEdit(self)
@@ -340,12 +524,21 @@ class CustomDialog(QDialog):
         for i, (nome, simbolo) in enumerate(delimitadores):
             chk = QCheckBox(nome)
             chk.simbolo = simbolo
+            chk.stateChanged.connect(self.update_tokenizer)  # Antes da pré-visualização
             chk.stateChanged.connect(self.update_preview)
             chk.stateChanged.connect(self.schedule_save)  # Debounce
             grid.addWidget(chk, i // 4, i % 4)
             self.chk_delimitadores[nome] = chk
         delimitadores_layout.addLayout(grid)
 
+        # Campos entre aspas: permite o delimitador dentro de "..." e com escape \;
+        self.chk_campos_aspas = QCheckBox("Campos entre aspas")
+        self.chk_campos_aspas.setToolTip('Campos entre aspas duplas podem conter o delimitador, ex.: pergunta ; "resposta, com vírgula"')
+        self.chk_campos_aspas.stateChanged.connect(self.update_tokenizer)
+        self.chk_campos_aspas.stateChanged.connect(self.update_preview)
+        self.chk_campos_aspas.stateChanged.connect(self.schedule_save)  # Debounce
+        delimitadores_layout.addWidget(self.chk_campos_aspas)
+
         self.group_splitter.addWidget(delimitadores_widget)
 
         self.group_splitter.setSizes([150, 150, 100])
@@ -363,6 +556,10 @@ class CustomDialog(QDialog):
         btn_add.clicked.connect(self.add_cards)
         btn_add.setToolTip("Adicionar Cards (Ctrl+R)")
         bottom_buttons_layout.addWidget(btn_add)
+        btn_simular = QPushButton("Simular")
+        btn_simular.clicked.connect(self.simulate_cards)
+        btn_simular.setToolTip("Executa a importação sem gravar nada e mostra um relatório")
+        bottom_buttons_layout.addWidget(btn_simular)
         bottom_layout.addLayout(bottom_buttons_layout)
         bottom_layout.addStretch()
 
@@ -380,6 +577,7 @@ class CustomDialog(QDialog):
             ("Ctrl+U", "apply_underline"),
             ("Ctrl+M", "destaque_texto"),
             ("Ctrl+P", "search_text"),
+            ("Ctrl+Shift+P", "search_previous"),
             ("Ctrl+Shift+R", "replace_text"),
             ("Ctrl+=", "zoom_in"),
             ("Ctrl+-", "zoom_out"),
@@ -412,13 +610,20 @@ class CustomDialog(QDialog):
 
     def _save_in_real_time(self):
         """Salva todas as configurações em tempo real com backup."""
+        if self.loading_text:
+            self.save_timer.start(500)  # Não salva o rascunho pela metade
+            return
         try:
             if os.path.exists(CONFIG_FILE):
                 shutil.copy2(CONFIG_FILE, CONFIG_FILE + ".bak")  # Backup
             dados = {
-                'conteudo': self.txt_entrada.toPlainText(),
-                'tags': self.txt_tags.toPlainText(),
+                'conteudo': self.draft_text.current().text,
+                'tags': self.tags_text.current().text,
                 'delimitadores': {nome: chk.isChecked() for nome, chk in self.chk_delimitadores.items()},
+                'campos_entre_aspas': self.chk_campos_aspas.isChecked(),
+                'modo_duplicatas': self.cmb_duplicatas.currentData(),
+                'pular_importadas': self.chk_pular_importadas.isChecked(),
+                'draft_id': self.draft_id,
                 'deck_selecionado': self.lista_decks.currentItem().text() if self.lista_decks.currentItem() else '',
                 'modelo_selecionado': self.lista_notetypes.currentItem().text() if self.lista_notetypes.currentItem() else '',
                 'field_mappings': self.field_mappings,
@@ -442,16 +647,100 @@ class CustomDialog(QDialog):
         self.toggle_tags_button.setText("Ocultar Etiquetas" if novo_estado else "Mostrar Etiquetas")
 
     def update_tags_lines(self):
-        linhas_cards = self.txt_entrada.toPlainText().strip().split('\n')
-        linhas_tags = self.txt_tags.toPlainText().strip().split('\n')
-
-        if len(linhas_tags) < len(linhas_cards):
-            self.txt_tags.setPlainText(self.txt_tags.toPlainText() + '\n' * (len(linhas_cards) - len(linhas_tags)))
-        elif len(linhas_tags) > len(linhas_cards):
-            self.txt_tags.setPlainText('\n'.join(linhas_tags[:len(linhas_cards)]))
+        # Compara a quantidade de blocos (O(1)); as linhas já acompanham cada
+        # edição (ver on_contents_change), aqui só se corrige o que sobrar
+        num_cards = self.txt_entrada.document().blockCount()
+        num_tags = self.txt_tags.document().blockCount()
+        if num_tags != num_cards:
+            self.resize_tag_lines(num_cards - num_tags)
 
         self.update_preview()
 
+    def resize_tag_lines(self, diferenca):
+        """Acrescenta ou remove linhas no fim das etiquetas, sem reescrever o texto."""
+        doc = self.txt_tags.document()
+        cursor = QTextCursor(doc)
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if diferenca > 0:
+            cursor.insertText('\n' * diferenca)
+        elif diferenca < 0:
+            ultima_mantida = doc.findBlockByNumber(doc.blockCount() + diferenca - 1)
+            cursor.setPosition(ultima_mantida.position() + ultima_mantida.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+
+    def mirror_tag_lines(self, primeira, deslocamento, no_inicio):
+        """Repete nas etiquetas as linhas inseridas (deslocamento > 0) ou removidas após `primeira`.
+
+        Só o trecho editado é tocado, com um cursor próprio: o cursor e o
+        histórico de desfazer das etiquetas continuam valendo. `no_inicio`
+        indica uma quebra de linha no começo da linha, que empurra o texto
+        (e portanto as etiquetas dele) para baixo.
+        """
+        doc = self.txt_tags.document()
+        if primeira >= doc.blockCount():
+            return  # Etiquetas mais curtas que o texto: update_tags_lines completa
+        bloco = doc.findBlockByNumber(primeira)
+        cursor = QTextCursor(doc)
+        if deslocamento > 0:
+            cursor.setPosition(bloco.position() if no_inicio else bloco.position() + bloco.length() - 1)
+            cursor.insertText('\n' * deslocamento)
+            return
+        ultima = doc.findBlockByNumber(min(primeira - deslocamento, doc.blockCount() - 1))
+        if not bloco.text():
+            # Linha sem etiquetas: fica a etiqueta da linha que foi juntada a ela
+            cursor.setPosition(bloco.position())
+            cursor.setPosition(ultima.position(), QTextCursor.MoveMode.KeepAnchor)
+        else:
+            cursor.setPosition(bloco.position() + bloco.length() - 1)
+            cursor.setPosition(ultima.position() + ultima.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+
+    def on_contents_change(self, position, removed, added):
+        """Traduz a edição do texto em linhas alteradas (lines_changed) e acompanha nas etiquetas."""
+        doc = self.txt_entrada.document()
+        total = doc.blockCount()
+        if self.highlighter.background and removed == added and total == self._block_count:
+            return  # Só formatação (destaque em segundo plano), o texto não mudou
+        anterior = self._block_count
+        deslocamento = total - anterior
+        self._block_count = total
+        primeira = doc.findBlock(position).blockNumber()
+        ultima = doc.findBlock(position + added).blockNumber()
+        if ultima < 0:  # Edição até o fim do documento
+            ultima = total - 1
+        adicionadas = ultima - primeira + 1
+        removidas = adicionadas - deslocamento
+        if deslocamento and not (primeira == 0 and removidas >= anterior):
+            # Troca do texto inteiro (setPlainText) não tem linha de origem: update_tags_lines ajusta o fim
+            no_inicio = position == doc.findBlock(position).position() and doc.characterAt(position) == '\u2029'
+            self._syncing_tags = True
+            try:
+                self.mirror_tag_lines(primeira, deslocamento, no_inicio)
+            finally:
+                self._syncing_tags = False
+        self.lines_changed.emit(primeira, removidas, adicionadas)
+
+    def visible_line_range(self):
+        """(primeira, última) linha visível do editor de cards."""
+        viewport = self.txt_entrada.viewport()
+        primeira = self.txt_entrada.cursorForPosition(QPoint(0, 0)).blockNumber()
+        ultima = self.txt_entrada.cursorForPosition(QPoint(viewport.width() - 1, viewport.height() - 1)).blockNumber()
+        return primeira, ultima
+
+    def on_tags_change(self, position, removed, added):
+        """Etiquetas editadas: os cards das mesmas linhas mudam no lugar."""
+        if self._syncing_tags:
+            return  # Linhas acompanhando o texto: on_contents_change já avisou
+        doc = self.txt_tags.document()
+        primeira = doc.findBlock(position).blockNumber()
+        ultima = doc.findBlock(position + added).blockNumber()
+        if ultima < 0:
+            ultima = doc.blockCount() - 1
+        # Linhas de etiquetas além do texto não correspondem a cards
+        ultima = min(ultima, self._block_count - 1)
+        if primeira <= ultima:
+            self.lines_changed.emit(primeira, ultima - primeira + 1, ultima - primeira + 1)
+
     def check_line_change(self):
         cursor = self.txt_entrada.textCursor()
         current_line = cursor.blockNumber()
@@ -463,10 +752,10 @@ class CustomDialog(QDialog):
 
     def focus_out_event(self, event):
         self.process_media_rename()
-        QTextEdit.focusOutEvent(self.txt_entrada, event)
+        QPlainTextEdit.focusOutEvent(self.txt_entrada, event)
 
     def process_media_rename(self):
-        current_text = self.txt_entrada.toPlainText()
+        current_text = self.draft_text.current().text
         if self.previous_text != current_text:
             patterns = [
                 r'<img src="([^"]+)"',
@@ -494,6 +783,7 @@ class CustomDialog(QDialog):
                                     os.path.join(media_dir, old_name),
                                     os.path.join(media_dir, new_name)
                                 )
+                                media_encoder.invalidate(os.path.join(media_dir, old_name))
                                 self.media_files[self.media_files.index(old_name)] = new_name
                                 showInfo(f"Arquivo renomeado de '{old_name}' para '{new_name}' na pasta de mídia.")
                             except Exception as e:
@@ -504,6 +794,7 @@ class CustomDialog(QDialog):
 
     def update_field_mappings(self):
         """Atualiza as opções de mapeamento de campos com base no modelo selecionado."""
+        self.invalidate_plan()
         # Limpar widgets existentes
         for combo in self.field_combo_boxes:
             self.fields_container_layout.removeWidget(combo)
@@ -559,6 +850,7 @@ class CustomDialog(QDialog):
             if "Ignorar" not in text:
                 campo = text.split(" -> ")[1]
                 self.field_mappings[str(i)] = campo
+        self.invalidate_plan()
         self.schedule_save()
         self.update_preview()
 
@@ -566,7 +858,7 @@ class CustomDialog(QDialog):
 
     def add_media_to_field(self, index, field_name):
         """Adiciona mídia (imagem, áudio ou vídeo) a um campo específico."""
-        linhas = [linha.strip() for linha in self.txt_entrada.toPlainText().strip().split('\n') if linha.strip()]
+        linhas = [linha.strip() for linha in self.draft_text.current().content_lines() if linha.strip()]
         num_cards = len(linhas)
         if num_cards == 0:
             showWarning("Digite pelo menos um card antes de adicionar mídia!")
@@ -631,12 +923,13 @@ class CustomDialog(QDialog):
         
         # Atualizar o texto com as mídias inseridas
         self.txt_entrada.setPlainText('\n'.join(linhas))
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         
         # Salvar as mídias no dicionário de field_images
         if field_name not in self.field_images:
             self.field_images[field_name] = []
         self.field_images[field_name] = selected_media[:num_cards]  # Limitar ao número de cards
+        self.invalidate_plan()
         
         self.schedule_save()
         self.update_preview()
@@ -645,135 +938,138 @@ class CustomDialog(QDialog):
 
 
 
+    def update_tokenizer(self):
+        """Recompila o tokenizer para a seleção atual de delimitadores."""
+        delimitadores = tuple(chk.simbolo for chk in self.chk_delimitadores.values() if chk.isChecked())
+        self.tokenizer = compile_tokenizer(delimitadores, self.chk_campos_aspas.isChecked()) if delimitadores else None
+        self.highlighter.set_delimiters(delimitadores)  # Só refaz o destaque se a seleção mudou
+        self.invalidate_plan()
+
+    def build_plan(self):
+        """Cria o ImportPlan com as opções atuais (None se faltar delimitador ou modelo)."""
+        if self.tokenizer is None or not self.lista_notetypes.currentItem():
+            return None
+        modelo = mw.col.models.by_name(self.lista_notetypes.currentItem().text())
+        deck = self.lista_decks.currentItem()
+        deck_id = mw.col.decks.by_name(deck.text())['id'] if deck else None
+        return ImportPlan.from_notetype(self.tokenizer, modelo, self.field_mappings, self.field_images,
+                                        self.chk_num_tags.isChecked(), deck_id)
+
+    def current_plan(self):
+        """ImportPlan das opções atuais, reaproveitado até alguma opção mudar."""
+        if self._plan is None:
+            self._plan = self.build_plan()
+        return self._plan
+
+    def invalidate_plan(self):
+        """Descarta o plano após mudança de opções.
+
+        O HTML em cache das opções antigas deixa de ser encontrado (a versão
+        faz parte da chave) e sai do LRU conforme o espaço for necessário.
+        """
+        self._plan = None
+        self.plan_version += 1
+        self.line_cache.clear()
+        self.plan_changed.emit()
+
+    def preview_cache_key(self, plan, linha, linha_tags, card_index):
+        """Chave do HTML de uma linha: conteúdo e tudo o que muda o resultado."""
+        return (
+            hash(linha),
+            plan.modelo['id'],
+            self.plan_version,  # Mapeamento, mídias por campo, delimitadores e deck
+            linha_tags,
+            plan.numerar_tags,
+            self.is_dark_theme,
+            card_index if plan.uses_card_index else None,
+        )
+
+    def render_preview_card(self, plan, card, linha):
+        """Dados do card para patchCard(), em JSON (mídias por URL, ver media_base_url)."""
+        media_dir = mw.col.media.dir()
+        campos, tags = card_fields(plan, card, linha,
+                                   media_transform=lambda html: thumbnail_media(link_media(html), media_dir))
+        return json.dumps({'campos': campos, 'tags': tags}, ensure_ascii=False)
+
+    def on_thumbnail_ready(self, path):
+        """Miniatura nova: descarta só o HTML em cache com o espaço reservado dela."""
+        marca = pending_marker(path)
+        removidas = self.preview_cache.discard_where(lambda chave, dados: marca in dados)
+        if self._preview_key in removidas:
+            self._preview_key = None
+            self.update_preview()
+
+    def media_base_url(self):
+        """Base URL das páginas de pré-visualização: a pasta de mídia da coleção."""
+        return QUrl.fromLocalFile(os.path.join(mw.col.media.dir(), ''))
+
     def update_preview(self):
+        """Pede a pré-visualização da linha atual (agendada, ver preview.py)."""
+        self.preview_scheduler.schedule()
+
+    def show_preview(self, chave, dados):
+        """Envia os dados do card (JSON) à página, a menos que ela já mostre o mesmo conteúdo."""
+        if chave == self._preview_key:
+            return
+        self._preview_key = chave
+        if not self._preview_ready:
+            # A página é carregada uma única vez; a atualização espera o loadFinished
+            self._preview_pending = dados
+            if not self._preview_loaded:
+                self._preview_loaded = True
+                self.preview_widget.setHtml(PREVIEW_PAGE, self.media_base_url())
+            return
+        self.preview_widget.page().runJavaScript(f"patchCard({dados})")
+
+    def on_preview_loaded(self, ok):
+        self._preview_ready = ok
+        if not ok:
+            # Tenta carregar de novo na próxima atualização
+            self._preview_loaded = False
+            self._preview_key = None
+            return
+        if self._preview_pending is not None:
+            self.preview_widget.page().runJavaScript(f"patchCard({self._preview_pending})")
+            self._preview_pending = None
+
+    def render_preview(self):
         try:
             cursor = self.txt_entrada.textCursor()
             self.current_line = cursor.blockNumber()
 
-            linhas = self.txt_entrada.toPlainText().strip().split('\n')
-            if not linhas or self.current_line >= len(linhas):
-                self.preview_widget.setHtml("")
-                return
-
-            linha = linhas[self.current_line]
+            # Lê só o bloco da linha atual, sem copiar o documento inteiro
+            linha = cursor.block().text()
             if not linha.strip():
-                self.preview_widget.setHtml("")
+                self.show_preview(None, "null")
                 return
 
-            delimitadores = [chk.simbolo for chk in self.chk_delimitadores.values() if chk.isChecked()]
-            if not delimitadores or not self.lista_decks.currentItem() or not self.lista_notetypes.currentItem():
-                self.preview_widget.setHtml("")
+            plan = self.current_plan()
+            if plan is None or not self.lista_decks.currentItem():
+                self.show_preview(None, "null")
                 return
 
-            modelo = mw.col.models.by_name(self.lista_notetypes.currentItem().text())
-            campos = [fld['name'] for fld in modelo['flds']]
-
-            linhas_tags = self.txt_tags.toPlainText().strip().split('\n')
-            tags_for_current_card = []
-            if self.current_line < len(linhas_tags):
-                tags_for_current_card = [tag.strip() for tag in linhas_tags[self.current_line].split(',') if tag.strip()]
+            bloco_tags = self.txt_tags.document().findBlockByNumber(self.current_line)
+            linha_tags = bloco_tags.text() if bloco_tags.isValid() else ''
 
             card_index = self.current_line
-            media_dir = mw.col.media.dir()
-
-            def get_mime_type(file_name):
-                ext = os.path.splitext(file_name)[1].lower()
-                return {
-                    '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
-                    '.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.ogg': 'audio/ogg', '.mp4': 'video/mp4',
-                    '.webm': 'video/webm'
-                }.get(ext, 'application/octet-stream')
-
-            def replace_media_src(match, media_type="img"):
-                file_name = match.group(1)
-                full_path = os.path.join(media_dir, file_name)
-                if not os.path.exists(full_path):
-                    print(f"Arquivo não encontrado: {full_path}")
-                    return match.group(0)
-                try:
-                    with open(full_path, 'rb') as f:
-                        base64_data = base64.b64encode(f.read()).decode('utf-8')
-                    mime_type = get_mime_type(file_name)
-                    return f'<{media_type} src="data:{mime_type};base64,{base64_data}"' + (" controls width=\"320\" height=\"240\"" if media_type == "video" else "")
-                except Exception as e:
-                    print(f"Erro ao codificar {media_type} em base64: {str(e)}")
-                    return match.group(0)
-
-            cards_html = """
-            <html><body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 10px;">
-            <style>
-                table {
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 5px 0;
-                }
-                th, td {
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                    text-align: left;
-                    vertical-align: top;
-                    width: 33%;
-                    box-sizing: border-box;
-                }
-                th {
-                    background-color: #f2f2f2;
-                    font-weight: bold;
-                }
-                ul, ol {
-                    margin: 5px 0;
-                    padding-left: 20px;
-                }
-            </style>
-            """
-            for delim in delimitadores:
-                if delim in linha:
-                    partes = linha.split(delim)
-                    card_html = """
-                    <table style="width: 100%; border-collapse: separate; border-spacing: 0; box-shadow: 0 4px 8px rgba(0,0,0,0.1); border-radius: 8px; margin-bottom: 20px;">
-                    """
-                    # Se nenhum mapeamento for definido, usar ordem padrão
-                    if not self.field_mappings:
-                        for i, parte in enumerate(partes):
-                            if i < len(campos):
-                                campo_nome = campos[i]
-                                campo_formatado = parte.strip()
-                                for tag, type_ in [('<img', 'img'), ('<source', 'source'), ('<video', 'video')]:
-                                    if tag in campo_formatado:
-                                        campo_formatado = re.sub(rf'{tag} src="([^"]+)"', lambda m: replace_media_src(m, type_), campo_formatado)
-                                if campo_nome in self.field_images and card_index < len(self.field_images[campo_nome]):
-                                    campo_formatado += f'<br><img src="{self.field_images[campo_nome][card_index]}">'
-                                card_html += f"""
-                                <tr><td style="background-color: #444; color: white; padding: 12px; text-align: center; font-weight: bold; font-size: 16px; border-top-left-radius: 8px; border-top-right-radius: 8px;">{campo_nome}</td></tr>
-                                <tr><td style="padding: 15px; border: 1px solid #ddd; background-color: white; border-bottom-left-radius: 8px; border-bottom-right-radius: 8px;">{campo_formatado}</td></tr>
-                                """
-                    else:
-                        for i, parte in enumerate(partes):
-                            campo_nome = self.field_mappings.get(str(i), "Ignorado")
-                            if campo_nome != "Ignorado":
-                                campo_formatado = parte.strip()
-                                for tag, type_ in [('<img', 'img'), ('<source', 'source'), ('<video', 'video')]:
-                                    if tag in campo_formatado:
-                                        campo_formatado = re.sub(rf'{tag} src="([^"]+)"', lambda m: replace_media_src(m, type_), campo_formatado)
-                                if campo_nome in self.field_images and card_index < len(self.field_images[campo_nome]):
-                                    campo_formatado += f'<br><img src="{self.field_images[campo_nome][card_index]}">'
-                                card_html += f"""
-                                <tr><td style="background-color: #444; color: white; padding: 12px; text-align: center; font-weight: bold; font-size: 16px; border-top-left-radius: 8px; border-top-right-radius: 8px;">{campo_nome}</td></tr>
-                                <tr><td style="padding: 15px; border: 1px solid #ddd; background-color: white; border-bottom-left-radius: 8px; border-bottom-right-radius: 8px;">{campo_formatado}</td></tr>
-                                """
-                    card_html += "</table>"
-
-                    if tags_for_current_card:
-                        if self.chk_num_tags.isChecked():
-                            tags_str = ', '.join(f"{tag}{card_index + 1}" for tag in tags_for_current_card)
-                        else:
-                            tags_str = ', '.join(tags_for_current_card)
-                        card_html += f"<p><b>Tags:</b> {tags_str}</p>"
-
-                    cards_html += card_html
-                    break
-
-            cards_html += "</body></html>"
-            self.preview_widget.setHtml(cards_html)
+            chave = self.preview_cache_key(plan, linha, linha_tags, card_index)
+            if chave == self._preview_key:
+                return  # A linha mostrada não mudou
+            dados = self.preview_cache.get(chave)
+            if dados is None:
+                indice = card_index if plan.uses_card_index else None
+                card = self.line_cache.get(self.current_line, linha, linha_tags, indice)
+                if card is None:
+                    card = self.line_cache.put(self.current_line, linha, linha_tags,
+                                               plan.parse_line(linha, self.current_line, card_index, linha_tags), indice)
+                dados = self.render_preview_card(plan, card, linha) if card is not None else "null"
+                self.preview_cache.put(chave, dados)
+            self.preview_widget.setToolTip(
+                f"Cache: {self.preview_cache.stats()}\n"
+                f"Renderizações: {self.preview_scheduler.renders} de {self.preview_scheduler.requests} pedidos, "
+                f"{self.preview_scheduler.cost_ms:.1f} ms em média"
+            )
+            self.show_preview(chave, dados)
         except Exception as e:
             logging.error(f"Erro no update_preview: {str(e)}")
             showWarning(f"Erro na pré-visualização: {str(e)}")
@@ -787,7 +1083,7 @@ class CustomDialog(QDialog):
             cursor.insertText(f'<span style="color:{color}"></span>')
             cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.MoveAnchor, 7)
             self.txt_entrada.setTextCursor(cursor)
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def apply_background_color(self, color):
@@ -799,7 +1095,7 @@ class CustomDialog(QDialog):
             cursor.insertText(f'<span style="background-color:{color}"></span>')
             cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.MoveAnchor, 7)
             self.txt_entrada.setTextCursor(cursor)
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def clear_all(self):
@@ -816,8 +1112,18 @@ class CustomDialog(QDialog):
 
             for chk in self.chk_delimitadores.values():
                 chk.setChecked(False)
+            self.chk_campos_aspas.setChecked(False)
             self.chk_num_tags.setChecked(False)
             self.chk_repetir_tags.setChecked(False)
+            self.cmb_duplicatas.setCurrentIndex(0)
+            self.chk_pular_importadas.setChecked(True)
+            if os.path.exists(LEDGER_FILE):
+                try:
+                    with ImportLedger(LEDGER_FILE) as ledger:
+                        ledger.forget(self.draft_id)  # O rascunho antigo não volta mais
+                except Exception as e:
+                    logging.error(f"Erro ao limpar o registro de importação: {str(e)}")
+            self.draft_id = new_draft_id()  # Texto novo, registro novo
             self.cloze_2_count = 1
             self.zoom_factor = 1.0
             self.txt_entrada.zoomOut(int((self.zoom_factor - 1.0) * 10))
@@ -826,8 +1132,7 @@ class CustomDialog(QDialog):
             self.current_line = 0
             self.previous_text = ""
             self.last_edited_line = -1
-            self.last_search_query = ""
-            self.last_search_position = 0
+            self.clear_search()
             self.field_mappings.clear()
             self.field_images.clear()
 
@@ -838,74 +1143,210 @@ class CustomDialog(QDialog):
             self.schedule_save()  # Salvar o estado limpo
             showInfo("Todos os campos e configurações foram limpos!")
 
-    def add_cards(self):
+    def still_loading(self):
+        """Avisa e retorna True se o rascunho ainda está entrando no editor (load_text)."""
+        if self.loading_text:
+            showWarning("Aguarde o carregamento do rascunho terminar.")
+        return self.loading_text
+
+    def prepare_import(self):
+        """Valida as opções e retorna (plano, linhas, linhas de etiquetas) ou None."""
+        if self.still_loading():
+            return None
         deck = self.lista_decks.currentItem()
         notetype = self.lista_notetypes.currentItem()
         if not deck or not notetype:
             showWarning("Selecione um deck e um modelo!")
-            return
-        delimitadores = [chk.simbolo for chk in self.chk_delimitadores.values() if chk.isChecked()]
-        if not delimitadores:
+            return None
+        plan = self.current_plan()
+        if plan is None:
             showWarning("Selecione pelo menos um delimitador!")
-            return
-        linhas = self.txt_entrada.toPlainText().strip().split('\n')
-        if not linhas:
+            return None
+        rascunho = self.draft_text.current()
+        if not rascunho.content_line_count:
             showWarning("Digite algum conteúdo!")
-            return
-        modelo = mw.col.models.by_name(notetype.text())
-        campos = [fld['name'] for fld in modelo['flds']]
-        contador = 0
-
-        linhas_tags = self.txt_tags.toPlainText().strip().split('\n')
-
-        card_index = 0
+            return None
+        linhas_tags = self.tags_text.current().content_lines()
+        return plan, rascunho.content_lines(), linhas_tags
 
-        for i, linha in enumerate(linhas):
-            if not linha.strip():
+    def add_cards(self):
+        preparado = self.prepare_import()
+        if preparado is not None:
+            self.run_import(*preparado)
+
+    def simulate_cards(self):
+        """Roda a importação sem gravar (em segundo plano) e mostra o relatório."""
+        preparado = self.prepare_import()
+        if preparado is None:
+            return
+        plan, linhas, linhas_tags = preparado
+        modo_duplicatas = self.cmb_duplicatas.currentData()
+        usar_registro = self.chk_pular_importadas.isChecked()
+        draft_id = self.draft_id
+        inicio = time.time()
+
+        def op(col):
+            if not usar_registro:
+                return simulate_import(col, plan, linhas, linhas_tags, modo_duplicatas)
+            with ImportLedger(LEDGER_FILE) as ledger:
+                return simulate_import(col, plan, linhas, linhas_tags, modo_duplicatas, ledger, draft_id)
+
+        def on_success(relatorio):
+            self.show_dry_run_report(relatorio, time.time() - inicio)
+
+        def on_failure(exc):
+            logging.error(f"Erro na simulação: {str(exc)}")
+            showWarning(f"Erro na simulação: {str(exc)}")
+
+        QueryOp(
+            parent=self,
+            op=op,
+            success=on_success,
+        ).failure(on_failure).with_progress("Simulando importação...").run_in_background()
+
+    def show_dry_run_report(self, relatorio, decorrido):
+        """Mostra o relatório da simulação: o que seria feito e o tempo de cada etapa."""
+        linhas_relatorio = [
+            f"Linhas: {relatorio.total_lines}",
+            f"Notas que seriam criadas: {relatorio.would_add}",
+        ]
+        if relatorio.already_imported:
+            linhas_relatorio.append(f"Linhas já importadas antes (seriam puladas): {relatorio.already_imported}")
+        if relatorio.would_update:
+            linhas_relatorio.append(f"Notas que seriam atualizadas: {relatorio.would_update}")
+        linhas_relatorio.append(f"Linhas sem delimitador ativo (ignoradas): {len(relatorio.skipped_lines)}")
+        linhas_relatorio.append(f"Linhas com número de campos diferente do esperado: {len(relatorio.field_mismatches)}")
+        linhas_relatorio.append(f"Mídias não encontradas: {len(relatorio.missing_media)}")
+        if relatorio.duplicates:
+            na_colecao = sum(1 for _, situacao in relatorio.duplicates if situacao == DUP_COLLECTION)
+            linhas_relatorio.append(
+                f"Duplicatas: {na_colecao} já na coleção, "
+                f"{len(relatorio.duplicates) - na_colecao} repetidas no próprio texto"
+            )
+
+        linhas_relatorio.append("")
+        linhas_relatorio.append("Tempo por etapa:")
+        for etapa, segundos in relatorio.timings.items():
+            linhas_relatorio.append(f"  {etapa}: {segundos * 1000:.1f} ms")
+        linhas_relatorio.append(f"  Total (com a espera da coleção): {decorrido:.2f} s")
+
+        # Detalhes, limitados para não travar a janela com rascunhos enormes
+        limite = 200
+        detalhes = [
+            ("Linhas ignoradas", [f"Linha {numero + 1}" for numero in relatorio.skipped_lines]),
+            ("Número de campos", [f"Linha {numero + 1}: {achadas} partes, esperadas {esperadas}"
+                                  for numero, achadas, esperadas in relatorio.field_mismatches]),
+            ("Mídias não encontradas", [f"Linha {numero + 1}: {nome}" for numero, nome in relatorio.missing_media]),
+            ("Erros ao montar as notas", [f"Linha {numero + 1}: {erro}" for numero, erro in relatorio.failures]),
+        ]
+        for titulo, itens in detalhes:
+            if not itens:
                 continue
-
-            for delim in delimitadores:
-                if delim in linha:
-                    partes = linha.split(delim)
-                    nota = mw.col.new_note(modelo)
-                    # Se nenhum mapeamento for definido, usar ordem padrão
-                    if not self.field_mappings:
-                        for idx, parte in enumerate(partes):
-                            if idx < len(campos):
-                                campo_nome = campos[idx]
-                                campo_idx = next(i for i, f in enumerate(modelo['flds']) if f['name'] == campo_nome)
-                                conteudo = parte.strip()
-                                if campo_nome in self.field_images and card_index < len(self.field_images[campo_nome]):
-                                    conteudo += f'<br><img src="{self.field_images[campo_nome][card_index]}">'
-                                nota.fields[campo_idx] = conteudo
-                    else:
-                        for idx, parte in enumerate(partes):
-                            if str(idx) in self.field_mappings:
-                                campo_nome = self.field_mappings[str(idx)]
-                                campo_idx = next(i for i, f in enumerate(modelo['flds']) if f['name'] == campo_nome)
-                                conteudo = parte.strip()
-                                if campo_nome in self.field_images and card_index < len(self.field_images[campo_nome]):
-                                    conteudo += f'<br><img src="{self.field_images[campo_nome][card_index]}">'
-                                nota.fields[campo_idx] = conteudo
-
-                    tags_for_card = []
-                    if i < len(linhas_tags):
-                        tags_for_card = [tag.strip() for tag in linhas_tags[i].split(',') if tag.strip()]
-                    if tags_for_card:
-                        if self.chk_num_tags.isChecked():
-                            nota.tags.extend([f"{tag}{card_index + 1}" for tag in tags_for_card])
-                        else:
-                            nota.tags.extend(tags_for_card)
-
-                    try:
-                        mw.col.add_note(nota, mw.col.decks.by_name(deck.text())['id'])
-                        contador += 1
-                        card_index += 1
-                    except Exception as e:
-                        print(f"Erro ao adicionar card: {str(e)}")
-                    break
-
-        showInfo(f"{contador} cards adicionados com sucesso!")
+            linhas_relatorio.append("")
+            linhas_relatorio.append(f"{titulo} ({len(itens)}):")
+            linhas_relatorio.extend(itens[:limite])
+            if len(itens) > limite:
+                linhas_relatorio.append(f"... e mais {len(itens) - limite}")
+        showText("\n".join(linhas_relatorio), parent=self, title="Simulação da importação")
+
+    def run_import(self, plan, linhas, linhas_tags):
+        """Grava as notas numa operação em segundo plano, com progresso e cancelamento."""
+        if self.import_running:
+            showWarning("Já existe uma importação em andamento!")
+            return
+        self.import_running = True
+        total = len(linhas)
+        cancelar = threading.Event()
+        modo_duplicatas = self.cmb_duplicatas.currentData()
+        usar_registro = self.chk_pular_importadas.isChecked()
+        draft_id = self.draft_id
+        inicio = time.time()
+
+        progresso = QProgressDialog("Adicionando cards...", "Cancelar", 0, total, self)
+        progresso.setWindowTitle("Adicionar Cards")
+        progresso.setWindowModality(Qt.WindowModality.WindowModal)
+        progresso.setMinimumDuration(0)
+        progresso.setAutoClose(False)
+        progresso.setAutoReset(False)
+        progresso.canceled.connect(cancelar.set)
+        progresso.show()
+
+        def on_progress(lidas, gravadas):
+            # Chamado na thread da operação; a interface só é tocada na principal
+            def atualizar():
+                decorrido = max(time.time() - inicio, 1e-6)
+                progresso.setValue(lidas)
+                progresso.setLabelText(
+                    f"Linhas analisadas: {lidas} de {total}\n"
+                    f"Notas gravadas: {gravadas}\n"
+                    f"{gravadas / decorrido:.0f} notas/s"
+                    + ("\nCancelando no fim do bloco atual..." if cancelar.is_set() else "")
+                )
+            mw.taskman.run_on_main(atualizar)
+
+        def importar(col, ledger=None):
+            return import_cards(col, plan, linhas, linhas_tags,
+                                progress=on_progress, should_cancel=cancelar.is_set,
+                                duplicates=modo_duplicatas, ledger=ledger, draft_id=draft_id)
+
+        def op(col):
+            # O registro (SQLite) é aberto na própria thread da operação
+            if usar_registro:
+                with ImportLedger(LEDGER_FILE) as ledger:
+                    resultado = importar(col, ledger)
+            else:
+                resultado = importar(col)
+            if resultado.changes is None:
+                resultado.changes = OpChanges(card=True, note=True, browser_table=True, study_queues=True)
+            return resultado
+
+        def finish():
+            self.import_running = False
+            progresso.close()
+
+        def on_success(resultado):
+            finish()
+            self.show_import_summary(resultado, total, time.time() - inicio)
+
+        def on_failure(exc):
+            finish()
+            logging.error(f"Erro ao adicionar cards: {str(exc)}")
+            showWarning(f"Erro ao adicionar cards: {str(exc)}")
+
+        CollectionOp(parent=self, op=op).success(on_success).failure(on_failure).run_in_background()
+
+    def show_import_summary(self, resultado, total, decorrido):
+        """Mostra o resumo da importação, com as linhas que falharam."""
+        linhas_resumo = [
+            f"Cards adicionados: {resultado.added}",
+            f"Tempo: {decorrido:.1f} s ({resultado.added / max(decorrido, 1e-6):.0f} notas/s)",
+        ]
+        if resultado.already_imported:
+            linhas_resumo.append(f"Linhas já importadas antes (puladas): {resultado.already_imported}")
+            if resultado.resumed_from is not None:
+                linhas_resumo.append(f"Importação retomada a partir da linha {resultado.resumed_from + 1}")
+        if resultado.duplicates:
+            na_colecao = sum(1 for _, situacao in resultado.duplicates if situacao == DUP_COLLECTION)
+            linhas_resumo.append(
+                f"Duplicatas: {na_colecao} já na coleção, "
+                f"{len(resultado.duplicates) - na_colecao} repetidas no próprio texto"
+            )
+            if resultado.updated:
+                linhas_resumo.append(f"Notas existentes atualizadas: {resultado.updated}")
+        if resultado.cancelled:
+            linhas_resumo.append(
+                f"Importação cancelada: linhas analisadas {resultado.lines_read} de {total}. "
+                f"As linhas a partir da {resultado.lines_read + 1} não foram adicionadas"
+                + (" e serão retomadas na próxima importação." if self.chk_pular_importadas.isChecked() else ".")
+            )
+        if resultado.failures:
+            linhas_resumo.append("")
+            linhas_resumo.append(f"Linhas com erro ({len(resultado.failures)}):")
+            linhas_resumo.extend(f"Linha {numero + 1}: {erro}" for numero, erro in resultado.failures)
+        if not resultado.cancelled and not resultado.failures and not resultado.duplicates and not resultado.already_imported:
+            showInfo(f"{resultado.added} cards adicionados com sucesso!")
+            return
+        showText("\n".join(linhas_resumo), parent=self, title="Resumo da importação")
 
     def add_image(self):
         arquivos, _ = QFileDialog.getOpenFileNames(self, "Selecionar Arquivos", "", "Mídia (*.png *.jpg *.jpeg *.gif *.mp3 *.wav *.ogg *.mp4 *.webm)")
@@ -924,7 +1365,7 @@ class CustomDialog(QDialog):
                     self.txt_entrada.insertPlainText(f'<audio controls=""><source src="{nome}" type="audio/mpeg"></audio>\n')
                 elif ext in ('.mp4', '.webm'):
                     self.txt_entrada.insertPlainText(f'<video src="{nome}" controls width="320" height="240"></video>\n')
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
 
     def drag_enter_event(self, event):
@@ -937,7 +1378,7 @@ class CustomDialog(QDialog):
             file_paths = [url.toLocalFile() for url in mime_data.urls()]
             self.process_files(file_paths)
             event.acceptProposedAction()
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def process_files(self, file_paths):
@@ -1091,7 +1532,7 @@ class CustomDialog(QDialog):
             self.txt_entrada.insertPlainText(text)
         else:
             showWarning("Nenhuma imagem, texto ou HTML encontrado na área de transferência.")
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def paste_excel(self):
@@ -1108,7 +1549,7 @@ class CustomDialog(QDialog):
                 formatted_lines.append(formatted_line)
             formatted_text = '\n'.join(formatted_lines)
             self.txt_entrada.insertPlainText(formatted_text)
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
         else:
             showWarning("Nenhum texto encontrado na área de transferência para colar como Excel.")
@@ -1163,7 +1604,7 @@ class CustomDialog(QDialog):
             html = re.sub(r'\s+', ' ', html).strip()
 
             self.txt_entrada.insertPlainText(html)
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
         elif mime_data.hasText():
             text = clipboard.text()
@@ -1171,7 +1612,7 @@ class CustomDialog(QDialog):
             lines = [line.strip() for line in lines if line.strip()]
             formatted_text = ' '.join(lines)
             self.txt_entrada.insertPlainText(formatted_text)
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
         else:
             showWarning("Nenhum texto encontrado na área de transferência para colar como Word.")
@@ -1267,7 +1708,7 @@ class CustomDialog(QDialog):
                     result_html += f'<span style="{style_str}">{formatted_text}</span><br>'
 
             self.txt_entrada.setPlainText(result_html)
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
             return
 
@@ -1278,7 +1719,7 @@ class CustomDialog(QDialog):
                     html = self.convert_rtf_to_html(rtf_data)
                     if html:
                         self.txt_entrada.setPlainText(html)
-                        self.previous_text = self.txt_entrada.toPlainText()
+                        self.previous_text = self.draft_text.current().text
                         self.update_preview()
                         return
                 except Exception as e:
@@ -1321,7 +1762,7 @@ class CustomDialog(QDialog):
 
             formatted_text = '<br>'.join(formatted_lines)
             self.txt_entrada.setPlainText(formatted_text)
-            self.previous_text = self.txt_entrada.toPlainText()
+            self.previous_text = self.draft_text.current().text
             self.update_preview()
             return
 
@@ -1392,7 +1833,7 @@ class CustomDialog(QDialog):
             self.txt_entrada.insertPlainText(text)
         else:
             showWarning("Nenhum texto ou HTML encontrado na área de transferência.")
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def eventFilter(self, obj, event):
@@ -1439,7 +1880,7 @@ class CustomDialog(QDialog):
             r'<video src="([^"]+)"'
         ]
 
-        current_text = self.txt_entrada.toPlainText()
+        current_text = self.draft_text.current().text
         media_dir = mw.col.media.dir()
         found_media = set()
 
@@ -1466,7 +1907,7 @@ class CustomDialog(QDialog):
                     background-color: #333;
                     color: #eee;
                 }
-                QTextEdit, QLineEdit, QListWidget {
+                QTextEdit, QPlainTextEdit, QLineEdit, QListWidget {
                     background-color: #444;
                     color: #fff;
                     border: 1px solid #555;
@@ -1506,7 +1947,7 @@ class CustomDialog(QDialog):
     def copy_media_files(self, dest_folder):
         """Copia todos os arquivos de mídia usados para a pasta de destino."""
         media_files = set()
-        text = self.txt_entrada.toPlainText()
+        text = self.draft_text.current().text
         
         # Encontra todos os arquivos de mídia referenciados
         for pattern in [r'src="([^"]+)"', r'<source src="([^"]+)"', r'<video src="([^"]+)"']:
@@ -1524,9 +1965,9 @@ class CustomDialog(QDialog):
 
 
     
-    def generate_export_html(self):
-        cards = self.txt_entrada.toPlainText().strip().split('\n')
-        tags = self.txt_tags.toPlainText().strip().split('\n')
+    def generate_export_html(self, plan):
+        linhas = self.draft_text.current().content_lines()
+        tags = self.tags_text.current().content_lines()
         
         def embed_media(content):
             media_dir = mw.col.media.dir()
@@ -1536,32 +1977,20 @@ class CustomDialog(QDialog):
                 file_name = match.group(1)
                 file_path = os.path.join(media_dir, file_name)
                 
-                if not os.path.exists(file_path):
+                # Codificação compartilhada com a pré-visualização (ver media_cache.py)
+                data_url = media_encoder.data_uri(file_path)
+                if data_url is None:
                     return full_tag
-                    
-                mime_type = {
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.png': 'image/png',
-                    '.gif': 'image/gif',
-                    '.mp3': 'audio/mpeg',
-                    '.wav': 'audio/wav',
-                    '.ogg': 'audio/ogg',
-                    '.mp4': 'video/mp4',
-                    '.webm': 'video/webm'
-                }.get(os.path.splitext(file_name)[1].lower(), 'application/octet-stream')
-                
-                with open(file_path, 'rb') as f:
-                    data = base64.b64encode(f.read()).decode('utf-8')
+                tipo_mime = mime_type(file_name)
                 
                 if file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                    return f'<div class="media-container"><img src="data:{mime_type};base64,{data}"></div>'
+                    return f'<div class="media-container"><img src="{data_url}"></div>'
                 
                 elif file_name.lower().endswith(('.mp3', '.wav', '.ogg')):
-                    return f'<div class="media-container"><audio controls><source src="data:{mime_type};base64,{data}" type="{mime_type}"></audio></div>'
+                    return f'<div class="media-container"><audio controls><source src="{data_url}" type="{tipo_mime}"></audio></div>'
                 
                 elif file_name.lower().endswith(('.mp4', '.webm')):
-                    return f'<div class="media-container"><video controls><source src="data:{mime_type};base64,{data}" type="{mime_type}"></video></div>'
+                    return f'<div class="media-container"><video controls><source src="{data_url}" type="{tipo_mime}"></video></div>'
                 
                 return full_tag
             
@@ -1600,33 +2029,27 @@ class CustomDialog(QDialog):
     
         cards_html = []
         
-        for i, card in enumerate(cards):
-            if not card.strip():
-                continue
-            
+        # Mesmo plano da importação: mesmos delimitadores, campos e etiquetas
+        for card in plan.parse(linhas, tags):
             card_tags = ""
-            if i < len(tags) and tags[i].strip():
-                card_tags = f'<div class="tags">Tags: {tags[i]}</div>'
+            etiquetas = plan.card_tags(card)
+            if etiquetas:
+                card_tags = f'<div class="tags">Tags: {", ".join(etiquetas)}</div>'
             
             fields_html = []
-            partes = card.split(';')
-            for j, parte in enumerate(partes):
-                field_name = f"Campo {j+1}"
-                if str(j) in self.field_mappings:
-                    field_name = self.field_mappings[str(j)]
-                
-                field_content = embed_media(parte.strip())
+            for campo_idx, conteudo in plan.field_values(card, linhas[card.line_number]):
+                field_content = embed_media(conteudo)
                 
                 fields_html.append(f"""
                     <div class="field">
-                        <div class="field-name">{field_name}</div>
+                        <div class="field-name">{plan.campos[campo_idx]}</div>
                         <div class="field-content">{field_content}</div>
                     </div>
                 """)
             
             cards_html.append(f"""
                 <div class="card">
-                    <div class="card-header">Card {i+1}</div>
+                    <div class="card-header">Card {card.card_index + 1}</div>
                     <div class="fields">
                         {''.join(fields_html)}
                     </div>
@@ -1641,8 +2064,14 @@ class CustomDialog(QDialog):
     
     def export_to_html(self):
         """Exporta cards para HTML com mídias incorporadas."""
+        if self.still_loading():
+            return
+        plan = self.current_plan()
+        if plan is None:
+            showWarning("Selecione um delimitador e um modelo para exportar!")
+            return
         try:
-            html_content = self.generate_export_html()
+            html_content = self.generate_export_html(plan)
             file_path, _ = QFileDialog.getSaveFileName(
                 self, "Exportar para HTML", "", "HTML Files (*.html)")
             
@@ -1672,8 +2101,8 @@ class CustomDialog(QDialog):
 
 
     def update_tag_numbers(self):
-        linhas_tags = self.txt_tags.toPlainText().strip().split('\n')
-        num_linhas_cards = len(self.txt_entrada.toPlainText().strip().splitlines())
+        linhas_tags = self.tags_text.current().content_lines()
+        num_linhas_cards = self.draft_text.current().content_line_count
 
         if not any(linhas_tags) and num_linhas_cards > 0:
             self.txt_tags.setPlainText('\n'.join(f"{i + 1}" for i in range(num_linhas_cards)))
@@ -1707,8 +2136,8 @@ class CustomDialog(QDialog):
 
     def update_repeated_tags(self):
         if self.chk_repetir_tags.isChecked() and not self.initial_tags_set:
-            linhas_tags = self.txt_tags.toPlainText().strip().split('\n')
-            num_cards = len(self.txt_entrada.toPlainText().strip().splitlines())
+            linhas_tags = self.tags_text.current().content_lines()
+            num_cards = self.draft_text.current().content_line_count
 
             if not any(linhas_tags):
                 self.txt_tags.setPlainText('\n' * (num_cards - 1))
@@ -1739,46 +2168,129 @@ class CustomDialog(QDialog):
         self.update_preview()
 
     def search_text(self):
+        """Vai para a próxima ocorrência da pesquisa."""
+        self.find_match(1)
+
+    def search_previous(self):
+        self.find_match(-1)
+
+    def search_pattern(self):
+        """Padrão da pesquisa com as opções marcadas, ou None (com aviso) se não houver."""
         search_query = self.search_input.text().strip()
         if not search_query:
             showWarning("Por favor, insira um texto para pesquisar.")
+            return None
+        try:
+            return compile_query(search_query, self.chk_busca_regex.isChecked(), self.chk_busca_palavra.isChecked())
+        except re.error as e:
+            showWarning(f"Expressão regular inválida: {str(e)}")
+            return None
+
+    def find_match(self, delta):
+        """Seleciona a ocorrência seguinte (delta=1) ou anterior (-1), montando o índice se preciso.
+
+        O índice vale para uma revisão do texto e as opções da pesquisa; em
+        rascunhos grandes ele é montado em segundo plano.
+        """
+        pattern = self.search_pattern()
+        if pattern is None:
+            return
+        snapshot = self.draft_text.current()
+        chave = (pattern.pattern, snapshot.revision)
+        if self.search_index is not None and self.search_index.key == chave:
+            self.goto_match(delta)
+            return
+        if len(snapshot.text) < LARGE_DRAFT_CHARS:
+            self.search_index = SearchIndex(pattern, snapshot.text, chave)
+            self.goto_match(delta)
+            return
+        if self._search_pending == chave:
+            return  # Já está sendo montado
+        self._search_pending = chave
+        self.search_count_label.setText("Pesquisando...")
+
+        def concluir(futuro):
+            if self._search_pending != chave:
+                return  # Pesquisa ou texto mudaram enquanto isso
+            self._search_pending = None
+            try:
+                self.search_index = futuro.result()
+            except Exception as e:
+                logging.error(f"Erro na pesquisa: {str(e)}")
+                self.search_count_label.setText("")
+                return
+            if self.search_index.key[1] == self.draft_text.revision:
+                self.goto_match(delta)
+
+        mw.taskman.run_in_background(lambda: SearchIndex(pattern, snapshot.text, chave), concluir)
+
+    def goto_match(self, delta):
+        indice = self.search_index
+        if not len(indice):
+            self.search_count_label.setText("0 resultados")
+            self.highlight_matches()
+            showWarning(f"Texto '{self.search_input.text().strip()}' não encontrado.")
             return
-        search_words = search_query.split()
-        if search_query != self.last_search_query:
-            self.last_search_query = search_query
-            self.last_search_position = 0
         cursor = self.txt_entrada.textCursor()
-        cursor.setPosition(self.last_search_position)
-        self.txt_entrada.setTextCursor(cursor)
-        found = False
-        for word in search_words:
-            if self.txt_entrada.find(word):
-                self.last_search_position = self.txt_entrada.textCursor().position()
-                found = True
-                break
-        if not found:
-            self.txt_entrada.moveCursor(QTextCursor.MoveOperation.Start)
-            for word in search_words:
-                if self.txt_entrada.find(word):
-                    self.last_search_position = self.txt_entrada.textCursor().position()
-                    found = True
-                    break
-        if not found:
-            showWarning(f"Texto '{search_query}' não encontrado.")
-        self.update_preview()
+        i = indice.step(delta, cursor.position(), (cursor.selectionStart(), cursor.selectionEnd()))
+        inicio, fim = indice.span(i)
+        cursor.setPosition(inicio)
+        cursor.setPosition(fim, QTextCursor.MoveMode.KeepAnchor)
+        self.txt_entrada.setTextCursor(cursor)  # A pré-visualização segue o cursor
+        self.txt_entrada.ensureCursorVisible()
+        self.search_count_label.setText(f"{i + 1} de {len(indice)}")
+        self.highlight_matches()
+
+    def highlight_matches(self):
+        """Destaca as ocorrências visíveis (extra selections); a atual com outra cor."""
+        indice = self.search_index
+        if indice is None or indice.key[1] != self.draft_text.revision:
+            self.txt_entrada.setExtraSelections([])
+            return
+        viewport = self.txt_entrada.viewport()
+        inicio = self.txt_entrada.cursorForPosition(QPoint(0, 0)).position()
+        fim = self.txt_entrada.cursorForPosition(QPoint(viewport.width() - 1, viewport.height() - 1)).position()
+        doc = self.txt_entrada.document()
+        selecoes = []
+        for i in indice.between(inicio - MAX_MATCH_SCAN, fim):
+            selecao = QTextEdit.ExtraSelection()
+            selecao.cursor = QTextCursor(doc)
+            selecao.cursor.setPosition(indice.starts[i])
+            selecao.cursor.setPosition(indice.ends[i], QTextCursor.MoveMode.KeepAnchor)
+            selecao.format.setBackground(QColor("#ff9632" if i == indice.current else "#fff176"))
+            selecoes.append(selecao)
+        self.txt_entrada.setExtraSelections(selecoes)
+
+    def clear_search(self):
+        """Esquece o índice (texto ou pesquisa mudaram) e tira o destaque."""
+        if self.search_index is None and self._search_pending is None:
+            return
+        self.search_index = None
+        self._search_pending = None
+        self.search_count_label.setText("")
+        self.txt_entrada.setExtraSelections([])
 
     def replace_text(self):
-        search_query = self.search_input.text().strip()
         replace_text = self.replace_input.text().strip()
-        if not search_query:
-            showWarning("Por favor, insira um texto para pesquisar.")
+        pattern = self.search_pattern()  # Com as mesmas opções da pesquisa
+        if pattern is None:
+            return
+        full_text = self.draft_text.current().text
+        if self.chk_busca_regex.isChecked():
+            try:
+                replaced_text, total = pattern.subn(lambda m: m.expand(replace_text), full_text)  # Aceita \1, \g<nome>
+            except re.error as e:
+                showWarning(f"Substituição inválida: {str(e)}")
+                return
+        else:
+            replaced_text, total = pattern.subn(lambda m: replace_text, full_text)
+        if not total:
+            showWarning("Nenhuma ocorrência encontrada.")
             return
-        full_text = self.txt_entrada.toPlainText()
-        replaced_text = re.sub(re.escape(search_query), replace_text, full_text, flags=re.IGNORECASE)
         self.txt_entrada.setPlainText(replaced_text)
         self.previous_text = replaced_text
         self.update_preview()
-        showInfo(f"Todas as ocorrências de '{search_query}' foram {'substituídas por ' + replace_text if replace_text else 'removidas'}.")
+        showInfo(f"{total} ocorrência(s) {'substituída(s) por ' + replace_text if replace_text else 'removida(s)'}.")
 
     def zoom_in(self):
         self.txt_entrada.zoomIn(1)
@@ -1824,8 +2336,8 @@ class CustomDialog(QDialog):
             self.txt_tags.setStyleSheet("")
             widget.setStyleSheet(f"border: 2px solid {'blue' if field_type == 'cards' else 'green'};")
             self.tags_label.setText("Etiquetas:" if field_type == "cards" else "Etiquetas (Selecionado)")
-            if isinstance(widget, QTextEdit):
-                QTextEdit.focusInEvent(widget, event)
+            if isinstance(widget, (QTextEdit, QPlainTextEdit)):
+                type(widget).focusInEvent(widget, event)
         return focus_in_event
 
 
@@ -1837,7 +2349,7 @@ class CustomDialog(QDialog):
         current_text = current_widget.toPlainText().strip().split("\n")
         result_lines = [f"{current_text[i] if i < len(current_text) else ''}{copied_text[i] if i < len(copied_text) else ''}".strip() for i in range(max(len(current_text), len(copied_text)))]
         current_widget.setPlainText("\n".join(result_lines))
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def add_cloze_1(self):
@@ -1847,7 +2359,7 @@ class CustomDialog(QDialog):
             showWarning("Por favor, selecione uma palavra para adicionar o cloze.")
             return
         cursor.insertText(f"{{{{c1::{selected_text}}}}}")
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def add_cloze_2(self):
@@ -1858,12 +2370,12 @@ class CustomDialog(QDialog):
             return
         cursor.insertText(f"{{{{c{self.cloze_2_count}::{selected_text}}}}}")
         self.cloze_2_count += 1
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def remove_cloze(self):
-        self.txt_entrada.setPlainText(re.sub(r'{{c\d+::(.*?)}}', r'\1', self.txt_entrada.toPlainText()))
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.txt_entrada.setPlainText(re.sub(r'{{c\d+::(.*?)}}', r'\1', self.draft_text.current().text))
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def load_settings(self):
@@ -1874,12 +2386,16 @@ class CustomDialog(QDialog):
                     dados = json.load(f)
                     conteudo = dados.get('conteudo', '')
                     logging.debug(f"Conteúdo carregado do CONFIG_FILE: '{conteudo}'")
-                    self.txt_entrada.setPlainText(conteudo)
-                    self.previous_text = self.txt_entrada.toPlainText()
+                    self.load_text(conteudo)
                     self.txt_tags.setPlainText(dados.get('tags', ''))
                     for nome, estado in dados.get('delimitadores', {}).items():
                         if nome in self.chk_delimitadores:
                             self.chk_delimitadores[nome].setChecked(estado)
+                    self.chk_campos_aspas.setChecked(dados.get('campos_entre_aspas', False))
+                    indice = self.cmb_duplicatas.findData(dados.get('modo_duplicatas', MODE_ADD))
+                    self.cmb_duplicatas.setCurrentIndex(max(indice, 0))
+                    self.chk_pular_importadas.setChecked(dados.get('pular_importadas', True))
+                    self.draft_id = dados.get('draft_id') or self.draft_id
                     for key, lista in [('deck_selecionado', self.lista_decks), ('modelo_selecionado', self.lista_notetypes)]:
                         if dados.get(key):
                             items = lista.findItems(dados[key], Qt.MatchFlag.MatchExactly)
@@ -1894,8 +2410,58 @@ class CustomDialog(QDialog):
         else:
             logging.debug("Arquivo CONFIG_FILE não encontrado")
 
+    def load_text(self, conteudo):
+        """Coloca o rascunho no editor de cards.
+
+        Rascunhos grandes entram em blocos de LOAD_CHUNK_CHARS, um por volta
+        do laço de eventos, com os sinais do editor e do documento desligados
+        (sem destaque, salvamento, pré-visualização ou sincronia das
+        etiquetas a cada bloco) e o editor somente leitura. No fim, um único
+        ajuste das etiquetas e uma única pré-visualização. Importar, simular,
+        exportar e visualizar esperam o fim do carregamento (still_loading).
+        """
+        self.previous_text = conteudo
+        if len(conteudo) < LARGE_DRAFT_CHARS:
+            if conteudo.count('\n') >= LAZY_BLOCKS:
+                self.highlighter.start_lazy()  # Destaca as linhas visíveis primeiro
+            self.txt_entrada.setPlainText(conteudo)
+            return
+        doc = self.txt_entrada.document()
+        self.loading_text = True
+        self.txt_entrada.setReadOnly(True)
+        self.txt_entrada.setUndoRedoEnabled(False)  # Sem histórico do carregamento
+        self.txt_entrada.blockSignals(True)
+        doc.blockSignals(True)
+        doc.clear()
+        self.draft_text.invalidate()  # Sem contentsChange até o fim do carregamento
+        cursor = QTextCursor(doc)
+
+        def proximo_bloco(inicio=0):
+            fim = conteudo.find('\n', inicio + LOAD_CHUNK_CHARS)
+            fim = len(conteudo) if fim < 0 else fim
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(conteudo[inicio:fim])
+            if fim < len(conteudo):
+                QTimer.singleShot(0, lambda: proximo_bloco(fim))
+                return
+            doc.blockSignals(False)
+            self.txt_entrada.blockSignals(False)
+            self.draft_text.invalidate()
+            self.line_cache.clear()
+            self.txt_entrada.setUndoRedoEnabled(True)
+            self.txt_entrada.setReadOnly(False)
+            self.loading_text = False
+            self._block_count = doc.blockCount()
+            self.txt_entrada.moveCursor(QTextCursor.MoveOperation.Start)
+            self.highlighter.start_lazy()  # Linhas visíveis primeiro, o resto em segundo plano
+            self.update_tags_lines()  # Ajusta as etiquetas e pede a pré-visualização
+
+        proximo_bloco()
+
     def closeEvent(self, event):
         """Lida com o fechamento do diálogo principal."""
+        self.preview_scheduler.cancel()
+        thumbnail_cache().ready.disconnect(self.on_thumbnail_ready)
         # Limpa a referência na janela principal
         if hasattr(mw, 'delimitadores_dialog'):
             mw.delimitadores_dialog = None
@@ -1909,7 +2475,7 @@ class CustomDialog(QDialog):
 
 
     def join_lines(self):
-        texto = self.txt_entrada.toPlainText()
+        texto = self.draft_text.current().text
         if '\n' not in texto:
             if hasattr(self, 'original_text'):
                 self.txt_entrada.setPlainText(self.original_text)
@@ -1917,7 +2483,7 @@ class CustomDialog(QDialog):
         else:
             self.original_text = texto
             self.txt_entrada.setPlainText(texto.replace('\n', ' '))
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def wrap_selected_text(self, tag):
@@ -1929,7 +2495,7 @@ class CustomDialog(QDialog):
             cursor.insertText(f"{tag[0]}{tag[1]}")
             cursor.movePosition(QTextCursor.MoveOperation.Left, QTextCursor.MoveMode.MoveAnchor, len(tag[1]))
             self.txt_entrada.setTextCursor(cursor)
-        self.previous_text = self.txt_entrada.toPlainText()
+        self.previous_text = self.draft_text.current().text
         self.update_preview()
 
     def apply_bold(self): self.wrap_selected_text(('<b>', '</b>'))
@@ -1983,6 +2549,8 @@ class CustomDialog(QDialog):
 
 
     def view_cards_dialog(self):
+        if self.still_loading():
+            return
         if self.visualizar_dialog is None or not self.visualizar_dialog.isVisible():
             self.visualizar_dialog = VisualizarCards(self)
             self.visualizar_dialog.show()
@@ -0,0 +1,124 @@
+# document.py
+
+"""Texto dos editores materializado uma vez por revisão (sem dependência do aqt).
+
+Vários pontos do diálogo (salvamento, renomeação de mídias, visualizador,
+exportação...) precisam do texto inteiro do rascunho, e cada
+`toPlainText()` copiava o documento de novo. O SnapshotSource acompanha as
+alterações do QTextDocument (contentsChange) e guarda um DocumentSnapshot
+imutável: o texto é copiado só na primeira leitura depois de uma alteração
+e todos os leitores da mesma revisão compartilham a mesma cópia. As linhas
+saem do mesmo snapshot: `line(n)` fatia a partir do índice de posições e
+`lines()`/`content_lines()` dividem o texto uma única vez por revisão.
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+
+_NEWLINE = re.compile('\n')
+# Primeiro caractere que não é espaço (início de text.strip())
+_CONTEUDO = re.compile(r'\S')
+
+
+class DocumentSnapshot:
+    """Texto de uma revisão do documento, com o início de cada linha."""
+
+    __slots__ = ('text', 'revision', '_offsets', '_lines', '_conteudo')
+
+    def __init__(self, text, revision=0):
+        self.text = text
+        self.revision = revision
+        self._offsets = None
+        self._lines = None
+        self._conteudo = None
+
+    @property
+    def offsets(self):
+        """Posição de início de cada linha (calculada na primeira consulta)."""
+        if self._offsets is None:
+            self._offsets = array('q', [0])
+            self._offsets.extend(m.end() for m in _NEWLINE.finditer(self.text))
+        return self._offsets
+
+    @property
+    def line_count(self):
+        return len(self.offsets)
+
+    def line(self, numero):
+        """Texto da linha `numero` (a partir de 0), sem o '\\n'."""
+        offsets = self.offsets
+        inicio = offsets[numero]
+        fim = offsets[numero + 1] - 1 if numero + 1 < len(offsets) else len(self.text)
+        return self.text[inicio:fim]
+
+    def line_at(self, posicao):
+        """Número da linha que contém a posição `posicao` do texto."""
+        return bisect_right(self.offsets, posicao) - 1
+
+    def lines(self):
+        """Todas as linhas (lista compartilhada entre os leitores: não altere)."""
+        if self._lines is None:
+            self._lines = self.text.split('\n')
+        return self._lines
+
+    def content_lines(self):
+        """Linhas de `text.strip()`, como a importação, a exportação e as etiquetas as contam.
+
+        Fatiada de `lines()` sem copiar o texto de novo; lista compartilhada
+        entre os leitores: não altere.
+        """
+        if self._conteudo is None:
+            texto = self.text
+            inicio = _CONTEUDO.search(texto)
+            if inicio is None:
+                self._conteudo = ['']
+                return self._conteudo
+            inicio = inicio.start()
+            fim = len(texto)
+            while texto[fim - 1].isspace():
+                fim -= 1
+            primeira, ultima = self.line_at(inicio), self.line_at(fim - 1)
+            linhas = self.lines()[primeira:ultima + 1]
+            if inicio > self.offsets[primeira]:
+                linhas[0] = linhas[0][inicio - self.offsets[primeira]:]
+            linhas[-1] = texto[max(self.offsets[ultima], inicio):fim]
+            self._conteudo = linhas
+        return self._conteudo
+
+    @property
+    def content_line_count(self):
+        """Linhas com conteúdo entre a primeira e a última (0 se o texto estiver vazio)."""
+        linhas = self.content_lines()
+        return len(linhas) if linhas != [''] else 0
+
+
+class SnapshotSource:
+    """Fornece o DocumentSnapshot da revisão atual de um QTextDocument.
+
+    Conecte-o ao documento antes dos outros leitores de contentsChange,
+    para que eles já vejam a revisão nova. `ignore(removed, added)` pode
+    descartar mudanças que não alteram o texto (só formatação). Se os sinais
+    do documento forem bloqueados, chame `invalidate` depois.
+    """
+
+    def __init__(self, document, ignore=None):
+        self.document = document
+        self.ignore = ignore
+        self.revision = 0
+        self._snapshot = None
+        document.contentsChange.connect(self._on_change)
+
+    def _on_change(self, position, removed, added):
+        if self.ignore is not None and self.ignore(removed, added):
+            return
+        self.invalidate()
+
+    def invalidate(self):
+        self.revision += 1
+        self._snapshot = None
+
+    def current(self):
+        if self._snapshot is None:
+            self._snapshot = DocumentSnapshot(self.document.toPlainText(), self.revision)
+        return self._snapshot
@@ -0,0 +1,107 @@
+# duplicates.py
+
+"""Detecção de duplicatas pelo primeiro campo, antes de gravar qualquer nota.
+
+Os checksums do primeiro campo (coluna `csum` da tabela notes) do tipo de
+nota de destino são lidos de uma vez, numa única consulta, para um índice em
+memória. Cada linha importada é então classificada como nova, duplicata da
+coleção ou duplicata de outra linha do mesmo lote, sem nenhuma busca por
+linha (`find_notes`). O texto dos campos só é lido para as notas cujo
+checksum coincide, para confirmar a duplicata.
+"""
+
+import html
+import re
+from hashlib import sha1
+
+try:
+    from anki.utils import field_checksum, strip_html_media
+except ImportError:  # Fora do Anki: mesmo cálculo usado pela coleção
+    _MIDIA = re.compile(r'<img[^>]+src=["\']?([^"\'>]+)["\']?[^>]*>', re.IGNORECASE)
+    _TAG_HTML = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+
+    def strip_html_media(texto):
+        texto = _MIDIA.sub(r' \1 ', texto)
+        return html.unescape(_TAG_HTML.sub('', texto)).strip()
+
+    def field_checksum(texto):
+        return int(sha1(strip_html_media(texto).encode('utf-8')).hexdigest()[:8], 16)
+
+# Classificação de cada linha
+NEW = 'new'
+DUP_COLLECTION = 'collection'
+DUP_BATCH = 'batch'
+
+# O que fazer com as duplicatas
+MODE_ADD = 'add'  # Comportamento antigo: adiciona sem verificar
+MODE_SKIP = 'skip'
+MODE_UPDATE = 'update'
+MODE_TAG = 'tag'
+MODES = (MODE_ADD, MODE_SKIP, MODE_UPDATE, MODE_TAG)
+DUPLICATE_TAG = 'duplicata'
+
+
+class DuplicateIndex:
+    """Ids das notas de um tipo de nota, indexados pelo checksum do primeiro campo."""
+
+    def __init__(self, col, mid):
+        self.col = col
+        self._ids = {}  # csum -> [ids das notas]
+        for nid, csum in col.db.execute("select id, csum from notes where mid = ?", mid):
+            self._ids.setdefault(csum, []).append(nid)
+        self._campos = {}  # csum -> [(id da nota, primeiro campo sem HTML)], lido sob demanda
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
+
+    def find(self, csum, primeiro):
+        """Id da nota da coleção com o mesmo primeiro campo (ou None)."""
+        ids = self._ids.get(csum)
+        if not ids:
+            return None
+        # O checksum tem 32 bits: confirma comparando o texto, lido só para estas notas
+        notas = self._campos.get(csum)
+        if notas is None:
+            linhas = self.col.db.execute(f"select id, flds from notes where id in ({','.join(map(str, ids))})")
+            notas = self._campos[csum] = [(nid, strip_html_media(flds.split('\x1f', 1)[0]))
+                                          for nid, flds in linhas]
+        for nid, texto in notas:
+            if texto == primeiro:
+                return nid
+        return None
+
+
+class DuplicateChecker:
+    """Classifica as linhas de uma importação contra a coleção e o próprio lote.
+
+    O índice é lido uma vez no início, antes de qualquer gravação, então as
+    notas criadas pela própria importação aparecem como duplicatas do lote,
+    e não da coleção.
+    """
+
+    def __init__(self, col, plan):
+        self.plan = plan
+        self.index = DuplicateIndex(col, plan.modelo['id'])
+        self._lote = {}  # (csum, primeiro campo) -> número da primeira linha
+
+    def check(self, card, linha):
+        """Retorna (classificação, id da nota existente ou None)."""
+        primeiro = None
+        for campo_idx, conteudo in self.plan.field_values(card, linha):
+            if campo_idx == 0:
+                primeiro = conteudo
+                break
+        if primeiro is None:
+            return NEW, None
+        texto = strip_html_media(primeiro)
+        if not texto:
+            return NEW, None
+        csum = field_checksum(primeiro)
+        nid = self.index.find(csum, texto)
+        if nid is not None:
+            return DUP_COLLECTION, nid
+        chave = (csum, texto)
+        if chave in self._lote:
+            return DUP_BATCH, None
+        self._lote[chave] = card.line_number
+        return NEW, None
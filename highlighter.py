@@ -1,26 +1,159 @@
 # highlighter.py
 
 import re
-from aqt.qt import QSyntaxHighlighter, QTextCharFormat, Qt
+from aqt.qt import QSyntaxHighlighter, QTextCharFormat, QTimer, Qt
+
+# Estado do bloco (linha) ao terminar: dentro de uma tag ou comentário ainda aberto
+NORMAL = -1
+IN_TAG = 1
+IN_COMMENT = 2
+
+# Comentário (pode continuar na linha seguinte) e tag fechada na mesma linha
+_COMENTARIO = r'<!--.*?(?:-->|$)'
+_TAG = r'<[A-Za-z/!][^<>]*>'
+# Tag que continua na linha seguinte: nome e só atributos até o fim da linha
+# (ex.: '<img src="a.jpg"'). Um '<' solto no texto ('a<b;c') não é tag.
+_ATRIBUTO = r"""[A-Za-z_:][\w:.-]*(?:\s*=\s*(?:"[^"]*"?|'[^']*'?|[^\s"'<>=`]+))?"""
+_TAG_ABERTA = rf'<[A-Za-z][\w:-]*(?:(?:\s+{_ATRIBUTO})+\s*|\s+)$'
+
+# Documentos a partir deste número de linhas são destacados aos poucos
+LAZY_BLOCKS = 2000
+# Linhas destacadas por volta do laço de eventos no modo preguiçoso
+LAZY_CHUNK = 500
+
 
 class HtmlTagHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
+    """Destaca tags HTML, comentários e os delimitadores ativos.
+
+    Um único padrão compilado (alternância) cobre tudo, recompilado só
+    quando os delimitadores mudam (set_delimiters). Comentários e tags com
+    atributos que continuam na linha seguinte ficam no estado do bloco, então
+    uma edição só refaz as linhas cujo estado mudou.
+    """
+
+    def __init__(self, parent=None, visible_range=None):
         super().__init__(parent)
-        self.highlighting_rules = []
-        
         # Formato para tags HTML (qualquer coisa entre < e >) - Vermelho
-        tag_format = QTextCharFormat()
-        tag_format.setForeground(Qt.GlobalColor.red)
-        self.highlighting_rules.append((re.compile(r'<[^>]+>'), tag_format))
+        self.tag_format = QTextCharFormat()
+        self.tag_format.setForeground(Qt.GlobalColor.red)
+
+        self.comment_format = QTextCharFormat()
+        self.comment_format.setForeground(Qt.GlobalColor.darkGray)
+
+        # Formato para os delimitadores - Fundo amarelo e letra preta
+        self.delimiter_format = QTextCharFormat()
+        self.delimiter_format.setBackground(Qt.GlobalColor.yellow)  # Fundo amarelo
+        self.delimiter_format.setForeground(Qt.GlobalColor.black)  # Letra preta
 
-        # Formato para ponto e vírgula (;) - Fundo amarelo e letra preta
-        semicolon_format = QTextCharFormat()
-        semicolon_format.setBackground(Qt.GlobalColor.yellow)  # Fundo amarelo
-        semicolon_format.setForeground(Qt.GlobalColor.black)  # Letra preta
-        self.highlighting_rules.append((re.compile(r';'), semicolon_format))
+        # Função que retorna (primeira, última) linha visível no editor
+        self.visible_range = visible_range
+        self._lazy = False
+        self._proximo = 0  # No modo preguiçoso: linhas antes desta já foram destacadas
+        self._visiveis = (0, -1)  # Linhas visíveis, lidas a cada trecho (não a cada linha)
+        # Passada do próprio destaque em andamento: as mudanças do documento são só de formato
+        self.background = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.resume)
+
+        self.delimitadores = None
+        self.set_delimiters((';',))
+
+    def set_delimiters(self, delimitadores):
+        """Recompila o padrão para os delimitadores e refaz o destaque (se mudaram)."""
+        delimitadores = tuple(delimitadores)
+        if delimitadores == self.delimitadores:
+            return
+        self.delimitadores = delimitadores
+        alternativas = [_COMENTARIO, _TAG, _TAG_ABERTA]
+        if delimitadores:
+            alternativas.append('|'.join(re.escape(d) for d in sorted(delimitadores, key=len, reverse=True)))
+        self.pattern = re.compile('|'.join(alternativas))
+        doc = self.document()
+        if doc is None:
+            return
+        if doc.blockCount() >= LAZY_BLOCKS:
+            self.start_lazy()
+        else:
+            self.background = True
+            try:
+                self.rehighlight()
+            finally:
+                self.background = False
+
+    def start_lazy(self):
+        """Destaca já só as linhas visíveis; as demais seguem em segundo plano.
+
+        Chame também antes de carregar um texto grande (setPlainText).
+        """
+        self._lazy = True
+        self._proximo = 0
+        self._visiveis = self.visible_range() if self.visible_range is not None else (0, -1)
+        primeira, ultima = self._visiveis
+        bloco = self.document().findBlockByNumber(max(0, primeira))
+        self.background = True
+        try:
+            while bloco.isValid() and bloco.blockNumber() <= ultima:
+                self.rehighlightBlock(bloco)
+                bloco = bloco.next()
+        finally:
+            self.background = False
+        self._timer.start(0)
+
+    def resume(self):
+        """Destaca o próximo trecho de LAZY_CHUNK linhas e agenda o seguinte."""
+        doc = self.document()
+        if doc is None or not self._lazy:
+            return
+        if self.visible_range is not None:
+            self._visiveis = self.visible_range()
+        bloco = doc.findBlockByNumber(self._proximo)
+        fim = self._proximo + LAZY_CHUNK
+        self.background = True
+        try:
+            while bloco.isValid() and self._proximo < fim:
+                self._proximo += 1
+                self.rehighlightBlock(bloco)
+                bloco = bloco.next()
+        finally:
+            self.background = False
+        if bloco.isValid():
+            self._timer.start(0)
+        else:
+            self._lazy = False
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            for match in pattern.finditer(text):
-                start, end = match.start(), match.end()
-                self.setFormat(start, end - start, format)
\ No newline at end of file
+        if self._lazy:
+            numero = self.currentBlock().blockNumber()
+            if numero >= self._proximo and not self._visiveis[0] <= numero <= self._visiveis[1]:
+                return  # Fica para o resume
+
+        inicio = 0
+        estado = self.previousBlockState()
+        if estado in (IN_TAG, IN_COMMENT):
+            # Continuação de uma tag ou comentário aberto numa linha anterior
+            fechamento = '>' if estado == IN_TAG else '-->'
+            fim = text.find(fechamento)
+            formato = self.tag_format if estado == IN_TAG else self.comment_format
+            if fim < 0:
+                self.setFormat(0, len(text), formato)
+                self.setCurrentBlockState(estado)
+                return
+            inicio = fim + len(fechamento)
+            self.setFormat(0, inicio, formato)
+
+        estado = NORMAL
+        for match in self.pattern.finditer(text, inicio):
+            start, end = match.start(), match.end()
+            trecho = match.group()
+            if trecho.startswith('<!--'):
+                self.setFormat(start, end - start, self.comment_format)
+                if not trecho.endswith('-->') or len(trecho) < 7:
+                    estado = IN_COMMENT
+            elif trecho.startswith('<') and len(trecho) > 1:
+                self.setFormat(start, end - start, self.tag_format)
+                if not trecho.endswith('>'):
+                    estado = IN_TAG
+            else:
+                self.setFormat(start, end - start, self.delimiter_format)
+        self.setCurrentBlockState(estado)
@@ -0,0 +1,115 @@
+# import_plan.py
+
+"""Plano de importação: tudo o que não muda de uma linha para outra.
+
+O ImportPlan é montado uma única vez a partir do tipo de nota, do mapeamento
+de campos, das mídias por campo, do deck e das opções de etiquetas. Depois
+disso, preencher uma nota com um card analisado é um laço simples sobre
+índices já resolvidos, sem procurar campos por nome. O mesmo plano serve à
+importação, à pré-visualização, ao VisualizarCards e à exportação em HTML.
+"""
+
+from .card_parser import CardParser, format_tags
+
+
+class ImportPlan:
+    def __init__(self, tokenizer, campos, field_mappings=None, field_images=None, numerar_tags=False,
+                 modelo=None, deck_id=None):
+        self.parser = CardParser(tokenizer, campos, field_mappings)
+        self.campos = self.parser.campos
+        self.modelo = modelo
+        self.deck_id = deck_id
+        self.numerar_tags = numerar_tags
+
+        # Mídias por campo, indexadas pela posição do campo no modelo
+        field_images = field_images or {}
+        self.imagens = [tuple(field_images.get(nome) or ()) for nome in self.campos]
+        # Numeração de etiquetas e mídias por campo dependem da posição do card
+        self.uses_card_index = bool(numerar_tags or any(self.imagens))
+        self.fill_note = self._compile_fill()
+
+    @classmethod
+    def from_notetype(cls, tokenizer, modelo, field_mappings=None, field_images=None, numerar_tags=False,
+                      deck_id=None):
+        """Plano para um tipo de nota do Anki (dicionário de `col.models`)."""
+        campos = [fld['name'] for fld in modelo['flds']]
+        return cls(tokenizer, campos, field_mappings, field_images, numerar_tags, modelo, deck_id)
+
+    def parse(self, linhas, linhas_tags=()):
+        return self.parser.parse(linhas, linhas_tags)
+
+    def parse_line(self, linha, line_number=0, card_index=0, linha_tags=''):
+        return self.parser.parse_line(linha, line_number, card_index, linha_tags)
+
+    def _compile_fill(self):
+        """Cria a função que preenche uma nota com um card, com tudo já resolvido."""
+        imagens = self.imagens
+        nomes = self.parser.tag_table.names
+        numerar = self.numerar_tags
+
+        def fill_note(nota, card, linha):
+            fields = nota.fields
+            spans = card.spans
+            valores = card.valores
+            card_index = card.card_index
+            for n in range(0, len(spans), 3):
+                campo_idx = spans[n]
+                if valores is None:
+                    conteudo = linha[spans[n + 1]:spans[n + 2]]
+                else:
+                    conteudo = valores[n // 3]
+                extras = imagens[campo_idx]
+                if card_index < len(extras):
+                    conteudo += f'<br><img src="{extras[card_index]}">'
+                fields[campo_idx] = conteudo
+            if card.tag_ids:
+                if numerar:
+                    # Mesmo resultado de format_tags, sem listas intermediárias
+                    sufixo = str(card_index + 1)
+                    nota.tags.extend(nomes[tag_id].rstrip('0123456789') + sufixo for tag_id in card.tag_ids)
+                else:
+                    nota.tags.extend(nomes[tag_id] for tag_id in card.tag_ids)
+
+        return fill_note
+
+    def field_values(self, card, linha, card_index=None):
+        """Conteúdo dos campos do card: lista de (índice do campo, conteúdo).
+
+        `linha` é a linha de origem do card. `card_index` permite renumerar o
+        card (ex.: visualizador) sem analisá-lo de novo.
+        """
+        if card_index is None:
+            card_index = card.card_index
+        spans = card.spans
+        campos = []
+        for n in range(0, len(spans), 3):
+            campo_idx = spans[n]
+            if card.valores is not None:
+                conteudo = card.valores[n // 3]
+            else:
+                conteudo = linha[spans[n + 1]:spans[n + 2]]
+            extras = self.imagens[campo_idx]
+            if card_index < len(extras):
+                conteudo += f'<br><img src="{extras[card_index]}">'
+            campos.append((campo_idx, conteudo))
+        return campos
+
+    def card_tags(self, card, card_index=None):
+        """Etiquetas finais do card, com numeração se ativada."""
+        if not card.tag_ids:
+            return []
+        if card_index is None:
+            card_index = card.card_index
+        nomes = self.parser.tag_table.names
+        return format_tags([nomes[tag_id] for tag_id in card.tag_ids], card_index, self.numerar_tags)
+
+    def media_refs(self, card, card_index=None):
+        """Arquivos de mídia usados pelo card (da linha e das mídias por campo)."""
+        if card_index is None:
+            card_index = card.card_index
+        refs = list(card.media)
+        for n in range(0, len(card.spans), 3):
+            extras = self.imagens[card.spans[n]]
+            if card_index < len(extras):
+                refs.append(extras[card_index])
+        return refs
@@ -0,0 +1,302 @@
+# importer.py
+
+"""Inserção dos cards analisados na coleção, em lotes (sem dependência do aqt).
+
+As notas são montadas e gravadas em blocos de CHUNK_SIZE com
+`col.add_notes`, e todos os blocos são unidos numa única entrada de desfazer.
+Uma linha que falha não interrompe as outras: o erro fica em
+ImportResult.failures para ser mostrado no final.
+
+Com um modo de duplicatas diferente de MODE_ADD, cada card é classificado
+por duplicates.DuplicateChecker antes de ser gravado, e as duplicatas são
+ignoradas, atualizam a nota existente ou ganham uma etiqueta.
+
+Pode rodar fora da thread principal (ex.: CollectionOp): o andamento é
+informado por `progress` e o cancelamento, consultado por `should_cancel`,
+só é atendido entre um bloco e outro.
+
+simulate_import percorre as mesmas etapas sem gravar nada e devolve um
+DryRunReport com o que seria feito e o tempo de cada etapa.
+"""
+
+import os
+import time
+
+try:
+    from anki.collection import AddNoteRequest
+except ImportError:  # Anki antigo (ou fora do Anki): inserção nota a nota
+    AddNoteRequest = None
+
+from .ledger import line_hash
+from .duplicates import DUP_BATCH, DUPLICATE_TAG, MODE_ADD, MODE_TAG, MODE_UPDATE, NEW, DuplicateChecker
+
+CHUNK_SIZE = 500
+UNDO_LABEL = "Adicionar Cards com Delimitadores"
+
+
+class ImportResult:
+    def __init__(self):
+        self.added = 0
+        self.note_ids = []
+        self.updated = 0
+        self.duplicates = []  # Lista de (número da linha, classificação)
+        self.failures = []  # Lista de (número da linha, mensagem de erro)
+        self.changes = None  # OpChanges da operação, quando disponível
+        self.lines_read = 0  # Linhas já analisadas
+        self.cancelled = False
+        self.already_imported = 0  # Linhas puladas por já estarem no registro
+        self.resumed_from = None  # Primeira linha importada ao retomar
+
+
+class DryRunReport:
+    def __init__(self):
+        self.total_lines = 0
+        self.would_add = 0
+        self.would_update = 0
+        self.already_imported = 0  # Linhas que o registro pularia
+        self.skipped_lines = []  # Linhas com texto mas sem delimitador ativo
+        self.field_mismatches = []  # Lista de (linha, partes encontradas, partes esperadas)
+        self.missing_media = []  # Lista de (linha, arquivo)
+        self.duplicates = []  # Lista de (linha, classificação)
+        self.failures = []  # Lista de (linha, mensagem de erro)
+        self.timings = {}  # Etapa -> segundos, na ordem de execução
+
+
+def build_note(col, plan, card, linha):
+    """Monta a nota de um card sem gravá-la."""
+    nota = col.new_note(plan.modelo)
+    plan.fill_note(nota, card, linha)
+    return nota
+
+
+def update_note(col, plan, nid, card, linha):
+    """Aplica o card sobre uma nota existente sem gravá-la."""
+    nota = col.get_note(nid)
+    plan.fill_note(nota, card, linha)
+    nota.tags = list(dict.fromkeys(nota.tags))
+    return nota
+
+
+def _flush_updates(col, lote, resultado):
+    """Grava um bloco de (número da linha, nota existente alterada).
+
+    Retorna os itens do bloco que foram gravados.
+    """
+    if hasattr(col, 'update_notes'):
+        try:
+            col.update_notes([nota for _, nota in lote])
+            resultado.updated += len(lote)
+            return lote
+        except Exception:
+            pass
+    gravados = []
+    for numero, nota in lote:
+        try:
+            col.update_note(nota)
+            resultado.updated += 1
+            gravados.append((numero, nota))
+        except Exception as e:
+            resultado.failures.append((numero, str(e)))
+    return gravados
+
+
+def _flush(col, lote, deck_id, resultado):
+    """Grava um bloco de (número da linha, nota).
+
+    Retorna os itens do bloco que foram gravados.
+    """
+    if AddNoteRequest is not None:
+        try:
+            col.add_notes([AddNoteRequest(note=nota, deck_id=deck_id) for _, nota in lote])
+            resultado.added += len(lote)
+            resultado.note_ids.extend(nota.id for _, nota in lote)
+            return lote
+        except Exception:
+            # O bloco é desfeito inteiro; repete nota a nota para achar as linhas com erro
+            pass
+    gravados = []
+    for numero, nota in lote:
+        try:
+            col.add_note(nota, deck_id)
+            resultado.added += 1
+            resultado.note_ids.append(nota.id)
+            gravados.append((numero, nota))
+        except Exception as e:
+            resultado.failures.append((numero, str(e)))
+    return gravados
+
+
+def import_target(plan):
+    """Destino da importação no registro: deck e tipo de nota."""
+    return f"{plan.deck_id}:{plan.modelo['id']}"
+
+
+def imported_hashes(col, ledger, draft_id, target, prune=True):
+    """Hashes das linhas registradas cuja nota ainda existe na coleção.
+
+    As notas são conferidas numa única consulta; as que sumiram (importação
+    desfeita, notas apagadas) saem do registro se `prune` for True.
+    """
+    registradas = ledger.imported(draft_id, target)
+    if not registradas:
+        return set()
+    ids = set(registradas.values())
+    existentes = set(col.db.list(f"select id from notes where id in ({','.join(map(str, ids))})"))
+    if prune and len(existentes) < len(ids):
+        ledger.forget_notes(draft_id, target, ids - existentes)
+    return {h for h, nid in registradas.items() if nid in existentes}
+
+
+def import_cards(col, plan, linhas, linhas_tags=(), chunk_size=CHUNK_SIZE,
+                 progress=None, should_cancel=None, duplicates=MODE_ADD, ledger=None, draft_id=None):
+    """Adiciona os cards das linhas ao deck do plano e retorna um ImportResult.
+
+    `progress(linhas_lidas, notas_gravadas)` é chamado após cada bloco e
+    `should_cancel()` é consultado logo depois; se retornar True, a
+    importação para ali, com os blocos anteriores já gravados.
+
+    `duplicates` é um dos modos de duplicates.MODES. Com um `ledger`
+    (ledger.ImportLedger) e o `draft_id` do rascunho, as linhas já
+    registradas no mesmo destino, cuja nota ainda existe, são puladas e cada
+    bloco gravado é registrado em seguida.
+    """
+    resultado = ImportResult()
+    undo_pos = col.add_custom_undo_entry(UNDO_LABEL) if hasattr(col, 'add_custom_undo_entry') else None
+
+    deck_id = plan.deck_id
+    # O índice de duplicatas e o registro são lidos antes da primeira gravação
+    checker = DuplicateChecker(col, plan) if duplicates != MODE_ADD else None
+    alvo = import_target(plan)
+    ja_importadas = imported_hashes(col, ledger, draft_id, alvo) if ledger is not None else set()
+    hashes = {}  # Número da linha -> hash, para as linhas do bloco atual
+    lote = []
+    atualizar = []
+
+    def gravar():
+        gravados = list(_flush(col, lote, deck_id, resultado)) if lote else []
+        gravados += _flush_updates(col, atualizar, resultado) if atualizar else []
+        if ledger is not None and gravados:
+            ledger.record(draft_id, alvo, [(hashes[numero], numero, nota.id) for numero, nota in gravados])
+        hashes.clear()
+
+    for card in plan.parse(linhas, linhas_tags):
+        resultado.lines_read = card.line_number + 1
+        linha = linhas[card.line_number]
+        if ledger is not None:
+            h = line_hash(linha, linhas_tags[card.line_number] if card.line_number < len(linhas_tags) else '')
+            if h in ja_importadas:
+                resultado.already_imported += 1
+                continue
+            if resultado.resumed_from is None and ja_importadas:
+                resultado.resumed_from = card.line_number
+            hashes[card.line_number] = h
+        try:
+            situacao = NEW
+            if checker is not None:
+                situacao, nid = checker.check(card, linha)
+                if situacao != NEW:
+                    resultado.duplicates.append((card.line_number, situacao))
+            if situacao == NEW or duplicates == MODE_TAG:
+                nota = build_note(col, plan, card, linha)
+                if situacao != NEW:
+                    nota.tags.append(DUPLICATE_TAG)
+                lote.append((card.line_number, nota))
+            elif duplicates == MODE_UPDATE and situacao != DUP_BATCH:
+                atualizar.append((card.line_number, update_note(col, plan, nid, card, linha)))
+            # MODE_SKIP, e duplicatas do lote em MODE_UPDATE: nada a gravar
+        except Exception as e:
+            resultado.failures.append((card.line_number, str(e)))
+            continue
+        if len(lote) + len(atualizar) >= chunk_size:
+            gravar()
+            lote = []
+            atualizar = []
+            if progress is not None:
+                progress(resultado.lines_read, resultado.added)
+            if should_cancel is not None and should_cancel():
+                resultado.cancelled = True
+                break
+    else:
+        resultado.lines_read = len(linhas)
+        gravar()
+        if progress is not None:
+            progress(resultado.lines_read, resultado.added)
+
+    if undo_pos is not None:
+        resultado.changes = col.merge_undo_entries(undo_pos)
+    return resultado
+
+
+def simulate_import(col, plan, linhas, linhas_tags=(), duplicates=MODE_ADD, ledger=None, draft_id=None):
+    """Executa a importação sem gravar nada e retorna um DryRunReport.
+
+    As etapas (análise, mapeamento, mídias, duplicatas e montagem das notas)
+    são as mesmas de import_cards e são cronometradas separadamente.
+    """
+    relatorio = DryRunReport()
+    relatorio.total_lines = len(linhas)
+
+    inicio = time.perf_counter()
+    cards = list(plan.parse(linhas, linhas_tags))
+    relatorio.timings['Análise'] = time.perf_counter() - inicio
+    validas = {card.line_number for card in cards}
+    relatorio.skipped_lines = [i for i, linha in enumerate(linhas) if linha.strip() and i not in validas]
+
+    if ledger is not None:
+        inicio = time.perf_counter()
+        ja_importadas = imported_hashes(col, ledger, draft_id, import_target(plan), prune=False)
+        pendentes = []
+        for card in cards:
+            n = card.line_number
+            if line_hash(linhas[n], linhas_tags[n] if n < len(linhas_tags) else '') in ja_importadas:
+                relatorio.already_imported += 1
+            else:
+                pendentes.append(card)
+        cards = pendentes
+        relatorio.timings['Registro'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    esperadas = plan.parser.expected_parts
+    for card in cards:
+        plan.field_values(card, linhas[card.line_number])
+        if card.part_count != esperadas:
+            relatorio.field_mismatches.append((card.line_number, card.part_count, esperadas))
+    relatorio.timings['Mapeamento'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    media_dir = col.media.dir()
+    existe = {}
+    for card in cards:
+        for nome in plan.media_refs(card):
+            if nome not in existe:
+                existe[nome] = os.path.exists(os.path.join(media_dir, nome))
+            if not existe[nome]:
+                relatorio.missing_media.append((card.line_number, nome))
+    relatorio.timings['Mídias'] = time.perf_counter() - inicio
+
+    situacoes = {}
+    if duplicates != MODE_ADD:
+        inicio = time.perf_counter()
+        checker = DuplicateChecker(col, plan)
+        for card in cards:
+            situacao, nid = checker.check(card, linhas[card.line_number])
+            if situacao != NEW:
+                situacoes[card.line_number] = (situacao, nid)
+                relatorio.duplicates.append((card.line_number, situacao))
+        relatorio.timings['Duplicatas'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for card in cards:
+        linha = linhas[card.line_number]
+        situacao, nid = situacoes.get(card.line_number, (NEW, None))
+        try:
+            if situacao == NEW or duplicates == MODE_TAG:
+                build_note(col, plan, card, linha)
+                relatorio.would_add += 1
+            elif duplicates == MODE_UPDATE and situacao != DUP_BATCH:
+                update_note(col, plan, nid, card, linha)
+                relatorio.would_update += 1
+        except Exception as e:
+            relatorio.failures.append((card.line_number, str(e)))
+    relatorio.timings['Montagem das notas'] = time.perf_counter() - inicio
+    return relatorio
@@ -0,0 +1,92 @@
+# ledger.py
+
+"""Registro persistente das linhas já importadas (sem dependência do aqt).
+
+Cada rascunho tem um identificador (draft_id, salvo no config.json). Para
+cada linha gravada na coleção, o registro guarda o hash do conteúdo da linha
+(com as etiquetas), o destino (deck e tipo de nota) e o id da nota criada.
+Como o registro é gravado a cada bloco, uma importação interrompida
+(cancelada ou com o Anki fechado) pode ser repetida: as linhas já
+registradas são puladas e a importação continua na primeira linha que
+ainda não entrou. Pelo mesmo motivo, rodar de novo depois de editar o
+rascunho importa só as linhas alteradas ou novas.
+
+Antes de pular uma linha, a importação confere se a nota registrada ainda
+existe (importer.imported_hashes): desfazer a importação ou apagar as
+notas libera as linhas de novo, e importar o mesmo rascunho para outro
+deck ou tipo de nota começa do zero. O "Limpar tudo" troca o draft_id e
+apaga o registro do rascunho antigo (forget).
+
+A conexão SQLite só pode ser usada na thread que a abriu: abra o registro
+dentro da operação em segundo plano (ex.: `with ImportLedger(...)`).
+"""
+
+import os
+import sqlite3
+import time
+import uuid
+from hashlib import sha1
+
+
+def new_draft_id():
+    return uuid.uuid4().hex
+
+
+def line_hash(linha, linha_tags=''):
+    """Hash estável entre sessões (o hash() do Python muda a cada execução)."""
+    return sha1(f"{linha}\x1f{linha_tags}".encode('utf-8')).hexdigest()
+
+
+class ImportLedger:
+    def __init__(self, path):
+        pasta = os.path.dirname(path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            create table if not exists registro (
+                draft_id text not null,
+                target text not null,
+                line_hash text not null,
+                line_number integer not null,
+                note_id integer not null,
+                imported_at integer not null,
+                primary key (draft_id, target, line_hash)
+            ) without rowid
+        """)
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def imported(self, draft_id, target):
+        """{hash da linha: id da nota} das linhas do rascunho já gravadas no destino, numa única consulta."""
+        return dict(self.db.execute("select line_hash, note_id from registro where draft_id = ? and target = ?",
+                                    (draft_id, target)))
+
+    def record(self, draft_id, target, linhas):
+        """Registra um bloco gravado: `linhas` é uma lista de (hash, número da linha, id da nota)."""
+        agora = int(time.time())
+        self.db.executemany(
+            "insert or replace into registro (draft_id, target, line_hash, line_number, note_id, imported_at) "
+            "values (?, ?, ?, ?, ?, ?)",
+            [(draft_id, target, h, numero, nid, agora) for h, numero, nid in linhas],
+        )
+        self.db.commit()
+
+    def forget_notes(self, draft_id, target, note_ids):
+        """Apaga o registro das notas que não existem mais (ex.: importação desfeita)."""
+        self.db.executemany("delete from registro where draft_id = ? and target = ? and note_id = ?",
+                            [(draft_id, target, nid) for nid in note_ids])
+        self.db.commit()
+
+    def forget(self, draft_id):
+        """Apaga o registro do rascunho (a próxima importação começa do zero)."""
+        self.db.execute("delete from registro where draft_id = ?", (draft_id,))
+        self.db.commit()
@@ -0,0 +1,55 @@
+# line_cache.py
+
+"""Cards já analisados por linha do editor (um bloco do QTextDocument por linha).
+
+Cada entrada guarda o ParsedCard de uma linha, validado pelo conteúdo da
+linha, pela linha de etiquetas e (se o resultado depender dela) pela posição
+do card. As edições chegam como lines_changed (traduzidas do contentsChange):
+só as linhas tocadas são descartadas e as seguintes são deslocadas, então o
+custo de uma edição não depende do tamanho do rascunho.
+
+O HTML da pré-visualização não fica aqui: ele vai para o LRUCache da
+pré-visualização, por conteúdo, e é reaproveitado também quando a linha muda
+de lugar. Este cache evita analisar de novo a linha quando o HTML saiu do
+LRU (limite de tamanho, miniatura nova).
+"""
+
+
+class LineCache:
+    def __init__(self):
+        self._entradas = {}  # Número do bloco -> (chave, card)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def get(self, numero, linha, linha_tags='', card_index=None):
+        """Card da linha se o conteúdo não mudou (ou None); card_index só quando o card depende dele."""
+        entrada = self._entradas.get(numero)
+        if entrada is not None and entrada[0] == (linha, linha_tags, card_index):
+            return entrada[1]
+        return None
+
+    def put(self, numero, linha, linha_tags, card, card_index=None):
+        self._entradas[numero] = ((linha, linha_tags, card_index), card)
+        return card
+
+    def invalidate(self, primeira, removidas, adicionadas):
+        """As linhas [primeira, primeira + removidas) viraram `adicionadas` linhas novas."""
+        if not self._entradas:
+            return
+        fim = primeira + removidas
+        deslocamento = adicionadas - removidas
+        if deslocamento == 0 and removidas <= len(self._entradas):
+            for numero in range(primeira, fim):
+                self._entradas.pop(numero, None)
+            return
+        entradas = {}
+        for numero, entrada in self._entradas.items():
+            if numero < primeira:
+                entradas[numero] = entrada
+            elif numero >= fim:
+                entradas[numero + deslocamento] = entrada
+        self._entradas = entradas
+
+    def clear(self):
+        self._entradas.clear()
@@ -0,0 +1,86 @@
+# media_cache.py
+
+"""Mídias no HTML dos cards: referências curtas ou data URIs (base64).
+
+A pré-visualização e o VisualizarCards usam `link_media`: as mídias ficam
+como nomes de arquivo e a página é carregada com a pasta de mídia como base
+URL, então só referências curtas passam para o processo do navegador e o
+vídeo é lido do disco sob demanda (com busca por intervalo).
+
+O HTML exportado precisa ser autocontido e usa o `media_encoder`: cada
+arquivo é lido e codificado uma vez por versão, com a chave (caminho, mtime,
+tamanho), então um arquivo alterado é recodificado sozinho. Renomear ou
+excluir pelo gerenciador de mídia chama `invalidate`. O cache é limitado em
+bytes (LRU).
+"""
+
+import base64
+import os
+import re
+import urllib.parse
+
+from .cache import LRUCache
+
+MIME_TYPES = {
+    '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
+    '.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.ogg': 'audio/ogg',
+    '.mp4': 'video/mp4', '.webm': 'video/webm',
+}
+
+# Limite do cache de data URIs, em caracteres (1 caractere = 1 byte em base64)
+MEDIA_CACHE_SIZE = 64 * 1024 * 1024
+
+# <img src="...">, <source src="..."> ou <video src="...">
+_MEDIA_TAG = re.compile(r'<(img|source|video) src="([^"]+)"')
+
+
+def mime_type(file_name):
+    return MIME_TYPES.get(os.path.splitext(file_name)[1].lower(), 'application/octet-stream')
+
+
+class MediaEncoder:
+    def __init__(self, max_size=MEDIA_CACHE_SIZE):
+        self.cache = LRUCache(max_size)
+        self._versoes = {}  # Caminho -> chave atual no cache
+
+    def data_uri(self, path):
+        """data URI do arquivo, ou None se ele não existir."""
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        chave = (path, info.st_mtime_ns, info.st_size)
+        uri = self.cache.get(chave)
+        if uri is None:
+            with open(path, 'rb') as f:
+                dados = base64.b64encode(f.read()).decode('ascii')
+            uri = f"data:{mime_type(path)};base64,{dados}"
+            anterior = self._versoes.get(path)
+            if anterior is not None and anterior != chave:
+                self.cache.pop(anterior)  # Versão antiga do arquivo
+            self.cache.put(chave, uri)
+            self._versoes[path] = chave
+        return uri
+
+    def invalidate(self, path):
+        """Esquece o arquivo (renomeado, excluído ou substituído)."""
+        chave = self._versoes.pop(path, None)
+        if chave is not None:
+            self.cache.pop(chave)
+
+
+media_encoder = MediaEncoder()
+
+
+def link_media(html):
+    """Deixa as mídias como referências relativas à pasta de mídia (base URL da página)."""
+    if 'src="' not in html:
+        return html
+
+    def substituir(match):
+        tipo, nome = match.groups()
+        # Nomes com espaço, "#" ou "?" precisam virar uma URL relativa válida
+        src = urllib.parse.quote(nome, safe="/%")
+        return f'<{tipo} src="{src}"' + (' controls width="320" height="240"' if tipo == "video" else "")
+
+    return _MEDIA_TAG.sub(substituir, html)
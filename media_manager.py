@@ -5,6 +5,8 @@ import subprocess  # Para abrir o arquivo com o player padrão
 from aqt.qt import *
 from aqt.utils import showInfo, showWarning
 from aqt.webview import QWebEngineView
+from .media_cache import MIME_TYPES, media_encoder
+from .thumbnails import thumbnail_cache
 
 class MediaManagerDialog(QDialog):
     def __init__(self, parent, media_files, txt_entrada, mw_instance):
@@ -55,6 +57,7 @@ class MediaManagerDialog(QDialog):
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
+                media_encoder.invalidate(file_path)
                 self.media_files.remove(file_name)
                 self.media_list.takeItem(self.media_list.currentRow())
                 # Atualizar o texto para remover referências ao arquivo excluído
@@ -88,6 +91,8 @@ class MediaManagerDialog(QDialog):
         if os.path.exists(old_path):
             try:
                 os.rename(old_path, new_path)
+                media_encoder.invalidate(old_path)
+                media_encoder.invalidate(new_path)
                 # Atualizar a lista de arquivos
                 index = self.media_files.index(old_name)
                 self.media_files[index] = new_name
@@ -131,27 +136,35 @@ class MediaManagerDialog(QDialog):
         dialog = QDialog(self)
         dialog.setWindowTitle(f"Visualizar: {file_name}")
         layout = QVBoxLayout()
-
-        # Carregar e exibir a imagem
-        image = QImage(file_path)
-        if image.isNull():
-            showWarning(f"Erro ao carregar a imagem '{file_name}'!")
-            return
-
-        label = QLabel()
-        pixmap = QPixmap.fromImage(image)
-        # Redimensionar a imagem para caber na janela, mantendo a proporção
         max_size = QSize(600, 400)
-        scaled_pixmap = pixmap.scaled(max_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        label.setPixmap(scaled_pixmap)
+
+        label = QLabel("Carregando...")
+        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        label.setMinimumSize(200, 150)
         layout.addWidget(label)
 
+        def mostrar(caminho):
+            # Miniatura (ou o próprio arquivo, se pequeno), redimensionada para caber na janela
+            image = QImage(caminho)
+            if image.isNull():
+                label.setText(f"Erro ao carregar a imagem '{file_name}'!")
+                return
+            pixmap = QPixmap.fromImage(image)
+            label.setPixmap(pixmap.scaled(max_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+
+        # O original inteiro só é decodificado se pedido
+        original_btn = QPushButton("Ver original", dialog)
+        original_btn.clicked.connect(lambda: (mostrar(file_path), original_btn.setEnabled(False)))
+        layout.addWidget(original_btn)
+
         # Botão para fechar
         #close_btn = QPushButton("Fechar", dialog)
         #close_btn.clicked.connect(dialog.accept)
         #layout.addWidget(close_btn)
 
         dialog.setLayout(layout)
+        # A miniatura é gerada em segundo plano na primeira vez
+        thumbnail_cache().request(file_path, lambda caminho: mostrar(caminho) if original_btn.isEnabled() else None)
         dialog.exec()
 
     def preview_gif(self, file_path, file_name):
@@ -271,11 +284,7 @@ class MediaManagerDialog(QDialog):
         dialog.exec()
 
     def get_mime_type(self, ext):
-        return {
-            '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
-            '.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.ogg': 'audio/ogg',
-            '.mp4': 'video/mp4', '.webm': 'video/webm'
-        }.get(ext, 'application/octet-stream')
+        return MIME_TYPES.get(ext, 'application/octet-stream')
 
 
     def closeEvent(self, event):
@@ -0,0 +1,64 @@
+# preview.py
+
+"""Agendamento da pré-visualização do diálogo principal.
+
+Uma tecla dispara vários sinais (textChanged, cursorPositionChanged, o
+ajuste das etiquetas...) e cada um pedia uma pré-visualização. O
+PreviewScheduler junta todos esses pedidos numa única renderização: o
+primeiro pedido arma um QTimer de disparo único e os seguintes, até ele
+disparar, não fazem nada.
+
+O atraso se adapta: enquanto a renderização é barata e o documento é
+pequeno, ela acontece já na próxima volta do laço de eventos (atraso 0).
+Se ela fica cara (cards com muitas mídias) ou o documento cresce, o atraso
+aumenta até MAX_DELAY_MS, para não travar a digitação.
+"""
+
+import time
+
+from aqt.qt import QObject, QTimer
+
+# Abaixo deste custo (ms) a renderização roda na próxima volta do laço
+CHEAP_RENDER_MS = 8
+MAX_DELAY_MS = 300
+# A partir de quantas linhas o tamanho do documento passa a pesar no atraso
+LARGE_DOCUMENT_LINES = 5000
+
+
+class PreviewScheduler(QObject):
+    def __init__(self, render, document_size=None, parent=None):
+        super().__init__(parent)
+        self.render = render  # Função que atualiza a pré-visualização
+        self.document_size = document_size  # Função que retorna o número de linhas
+        self.cost_ms = 0.0  # Custo médio (média móvel) de uma renderização
+        self.requests = 0  # Pedidos recebidos
+        self.renders = 0  # Renderizações feitas
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._run)
+
+    def delay(self):
+        """Atraso (ms) do próximo disparo, pelo custo medido e pelo tamanho do documento."""
+        linhas = self.document_size() if self.document_size is not None else 0
+        if self.cost_ms < CHEAP_RENDER_MS and linhas < LARGE_DOCUMENT_LINES:
+            return 0
+        atraso = self.cost_ms * 2 + linhas / LARGE_DOCUMENT_LINES * CHEAP_RENDER_MS
+        return int(min(MAX_DELAY_MS, atraso))
+
+    def schedule(self):
+        """Pede uma renderização; pedidos seguidos viram uma só."""
+        self.requests += 1
+        if not self.timer.isActive():
+            self.timer.start(self.delay())
+
+    def cancel(self):
+        self.timer.stop()
+
+    def _run(self):
+        inicio = time.perf_counter()
+        try:
+            self.render()
+        finally:
+            custo = (time.perf_counter() - inicio) * 1000
+            self.cost_ms = custo if not self.renders else self.cost_ms * 0.7 + custo * 0.3
+            self.renders += 1
@@ -0,0 +1,35 @@
+# render.py
+
+"""HTML dos cards, gerado sob demanda a partir de um ParsedCard (sem aqt)."""
+
+
+def card_fields(plan, card, linha, card_index=None, media_transform=None):
+    """Campos e etiquetas de um card: ([(nome do campo, conteúdo)], [etiquetas]).
+
+    `media_transform`, se informado, recebe o conteúdo de cada campo e devolve
+    o conteúdo com as mídias ajustadas (ex.: embutidas em base64).
+    """
+    campos = []
+    for campo_idx, conteudo in plan.field_values(card, linha, card_index):
+        if media_transform is not None:
+            conteudo = media_transform(conteudo)
+        campos.append((plan.campos[campo_idx], conteudo))
+    return campos, plan.card_tags(card, card_index)
+
+
+def card_table_html(plan, card, linha, card_index=None, media_transform=None):
+    """Tabela com os campos e as etiquetas de um card (ver card_fields)."""
+    campos, tags = card_fields(plan, card, linha, card_index, media_transform)
+    card_html = """
+    <table style="width: 100%; border-collapse: separate; border-spacing: 0; box-shadow: 0 4px 8px rgba(0,0,0,0.1); border-radius: 8px; margin-bottom: 20px;">
+    """
+    for nome, conteudo in campos:
+        card_html += f"""
+        <tr><td style="background-color: #444; color: white; padding: 12px; text-align: center; font-weight: bold; font-size: 16px; border-top-left-radius: 8px; border-top-right-radius: 8px;">{nome}</td></tr>
+        <tr><td style="padding: 15px; border: 1px solid #ddd; background-color: white; border-bottom-left-radius: 8px; border-bottom-right-radius: 8px;">{conteudo}</td></tr>
+        """
+    card_html += "</table>"
+
+    if tags:
+        card_html += f"<p><b>Tags:</b> {', '.join(tags)}</p>"
+    return card_html
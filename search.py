@@ -0,0 +1,71 @@
+# search.py
+
+"""Índice de ocorrências da pesquisa no rascunho (sem dependência do aqt).
+
+O SearchIndex percorre o texto de um DocumentSnapshot uma única vez e
+guarda o início e o fim de cada ocorrência. Com o índice, "próxima" e
+"anterior" são saltos O(1) a partir da ocorrência atual, a contagem "n de
+m" é imediata e as ocorrências de um trecho (as linhas visíveis, para o
+destaque) saem por busca binária. Como o texto do snapshot é imutável, o
+índice pode ser montado numa thread de fundo.
+
+As posições ficam em unidades UTF-16, as mesmas do QTextDocument.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Caracteres fora do plano básico ocupam duas posições no QTextDocument
+_ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def compile_query(query, regex=False, whole_word=False):
+    """Padrão da pesquisa (sem diferenciar maiúsculas); re.error se a expressão for inválida."""
+    padrao = query if regex else re.escape(query)
+    if whole_word:
+        padrao = rf'\b(?:{padrao})\b'
+    return re.compile(padrao, re.IGNORECASE)
+
+
+class SearchIndex:
+    def __init__(self, pattern, text, key=None):
+        self.pattern = pattern
+        self.key = key  # Consulta, opções e revisão do texto usados na montagem
+        self.starts = array('q')
+        self.ends = array('q')
+        for match in pattern.finditer(text):
+            if match.end() > match.start():  # Ocorrências vazias (ex.: "a*") não são navegáveis
+                self.starts.append(match.start())
+                self.ends.append(match.end())
+        astrais = [m.start() for m in _ASTRAL.finditer(text)] if not text.isascii() else ()
+        if astrais:
+            for posicoes in (self.starts, self.ends):
+                for i, posicao in enumerate(posicoes):
+                    posicoes[i] = posicao + bisect_left(astrais, posicao)
+        self.current = -1  # Ocorrência selecionada
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, i):
+        return self.starts[i], self.ends[i]
+
+    def step(self, delta, posicao, selecao=None):
+        """Avança `delta` (1 ou -1) e retorna o índice da ocorrência.
+
+        Se `selecao` (início, fim) é a ocorrência atual, o salto é O(1); senão
+        parte da posição do cursor.
+        """
+        total = len(self.starts)
+        if 0 <= self.current < total and selecao == self.span(self.current):
+            self.current = (self.current + delta) % total
+        elif delta > 0:
+            self.current = bisect_left(self.starts, posicao) % total
+        else:
+            self.current = (bisect_left(self.starts, posicao) - 1) % total
+        return self.current
+
+    def between(self, inicio, fim):
+        """Índices das ocorrências que começam entre as posições `inicio` e `fim`."""
+        return range(bisect_left(self.starts, inicio), bisect_right(self.starts, fim))
@@ -0,0 +1,179 @@
+# test_api.py
+
+"""Testes da API sem janela (api.py) contra uma coleção substituta.
+
+A coleção substituta oferece só o que a docstring de api.py lista, com a
+tabela notes num SQLite em memória; rode com `python -m pytest` na pasta
+do add-on.
+"""
+
+import importlib
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+# O add-on é um pacote com o nome da pasta (ex.: o número do AnkiWeb)
+_PASTA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(_PASTA))
+addon = importlib.import_module(os.path.basename(_PASTA))
+checksum = importlib.import_module(os.path.basename(_PASTA) + '.duplicates').field_checksum
+
+
+class FakeNote:
+    def __init__(self, modelo):
+        self.mid = modelo['id']
+        self.fields = [''] * len(modelo['flds'])
+        self.tags = []
+        self.id = 0
+
+
+class FakeDB:
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("create table notes (id integer primary key, mid integer, csum integer, flds text)")
+
+    def execute(self, sql, *args):
+        return self.conn.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [linha[0] for linha in self.conn.execute(sql, args)]
+
+
+class FakeMedia:
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def dir(self):
+        return self.pasta
+
+
+class FakeCollection:
+    """Coleção com um tipo de nota "Básico" (Frente, Verso) e os decks "Inglês" e "Revisão"."""
+
+    def __init__(self, media_dir):
+        self.modelo = {'id': 1, 'name': 'Básico', 'flds': [{'name': 'Frente'}, {'name': 'Verso'}]}
+        self.deck = {'id': 10, 'name': 'Inglês'}
+        self.outro_deck = {'id': 20, 'name': 'Revisão'}
+        self.db = FakeDB()
+        self.media = FakeMedia(media_dir)
+        self.models = self
+        self.decks = self
+        self.notes = {}  # id -> (FakeNote, id do deck)
+
+    def by_name(self, nome):
+        for item in (self.modelo, self.deck, self.outro_deck):
+            if item['name'] == nome:
+                return item
+        return None
+
+    def new_note(self, modelo):
+        return FakeNote(modelo)
+
+    def add_note(self, nota, deck_id):
+        nota.id = len(self.notes) + 1
+        self.notes[nota.id] = (nota, deck_id)
+        self.db.conn.execute("insert into notes values (?, ?, ?, ?)",
+                             (nota.id, nota.mid, checksum(nota.fields[0]), '\x1f'.join(nota.fields)))
+
+    def get_note(self, nid):
+        return self.notes[nid][0]
+
+    def update_note(self, nota):
+        self.db.conn.execute("update notes set csum = ?, flds = ? where id = ?",
+                             (checksum(nota.fields[0]), '\x1f'.join(nota.fields), nota.id))
+
+    def remove_notes(self, ids):
+        for nid in ids:
+            del self.notes[nid]
+            self.db.conn.execute("delete from notes where id = ?", (nid,))
+
+
+class ParseTextTest(unittest.TestCase):
+    def test_fields_and_tags(self):
+        cards = addon.parse_text("gato;cat\nsem delimitador\ncão;dog", [';'], ['Frente', 'Verso'],
+                                 tags="animais, inglês")
+        self.assertEqual([card['line'] for card in cards], [0, 2])
+        self.assertEqual(cards[1]['fields'], {'Frente': 'cão', 'Verso': 'dog'})
+        self.assertEqual(cards[0]['tags'], ['animais', 'inglês'])
+
+    def test_quoted_fields(self):
+        cards = addon.parse_text('"a; b";c\nx;"y', [';'], ['Frente', 'Verso'], quoted=True)
+        self.assertEqual(cards[0]['fields'], {'Frente': 'a; b', 'Verso': 'c'})
+        # Aspa sem fechamento: nada de texto repetido
+        self.assertEqual(cards[1]['fields'], {'Frente': 'x', 'Verso': 'y'})
+
+    def test_unclosed_quote_is_not_duplicated(self):
+        cards = addon.parse_text('"Pergunta;resposta', [';'], ['Frente', 'Verso'], quoted=True)
+        self.assertEqual(cards[0]['fields']['Frente'], 'Pergunta;resposta')
+
+
+class ImportTextTest(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.col = FakeCollection(self.pasta.name)
+        self.ledger = os.path.join(self.pasta.name, 'registro.sqlite')
+
+    def tearDown(self):
+        self.pasta.cleanup()
+
+    def importar(self, texto, **opcoes):
+        return addon.import_text(self.col, texto, 'Inglês', 'Básico', [';'], **opcoes)
+
+    def test_adds_notes_to_deck(self):
+        resultado = self.importar("gato;cat\ncão;dog")
+        self.assertEqual(resultado.added, 2)
+        self.assertEqual(resultado.failures, [])
+        nota, deck_id = self.col.notes[resultado.note_ids[1]]
+        self.assertEqual((nota.fields, deck_id), (['cão', 'dog'], 10))
+
+    def test_duplicates_skip(self):
+        self.importar("gato;cat")
+        resultado = self.importar("gato;kitty\ncão;dog\ncão;hound", duplicates='skip')
+        self.assertEqual(resultado.added, 1)
+        self.assertEqual(resultado.duplicates, [(0, 'collection'), (2, 'batch')])
+
+    def test_duplicates_update(self):
+        primeiro = self.importar("gato;cat")
+        resultado = self.importar("gato;kitty", duplicates='update')
+        self.assertEqual((resultado.added, resultado.updated), (0, 1))
+        self.assertEqual(self.col.get_note(primeiro.note_ids[0]).fields, ['gato', 'kitty'])
+
+    def test_ledger_skips_imported_lines(self):
+        opcoes = {'ledger_path': self.ledger, 'draft_id': 'rascunho'}
+        self.importar("gato;cat", **opcoes)
+        resultado = self.importar("gato;cat\ncão;dog", **opcoes)
+        self.assertEqual((resultado.added, resultado.already_imported), (1, 1))
+
+    def test_ledger_forgets_removed_notes(self):
+        opcoes = {'ledger_path': self.ledger, 'draft_id': 'rascunho'}
+        primeiro = self.importar("gato;cat\ncão;dog", **opcoes)
+        self.col.remove_notes(primeiro.note_ids)  # Como desfazer a importação
+        resultado = self.importar("gato;cat\ncão;dog", **opcoes)
+        self.assertEqual((resultado.added, resultado.already_imported), (2, 0))
+
+    def test_ledger_is_per_deck(self):
+        self.importar("gato;cat", ledger_path=self.ledger, draft_id='rascunho')
+        resultado = addon.import_text(self.col, "gato;cat", 'Revisão', 'Básico', [';'],
+                                      ledger_path=self.ledger, draft_id='rascunho')
+        self.assertEqual((resultado.added, resultado.already_imported), (1, 0))
+        self.assertEqual(self.col.notes[resultado.note_ids[0]][1], 20)
+
+
+class SimulateTextTest(unittest.TestCase):
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            col = FakeCollection(pasta)
+            col.add_note(FakeNote(col.modelo), 10)  # Nota vazia não conta como duplicata
+            relatorio = addon.simulate_text(col, 'gato;cat\nsó texto\ncão;<img src="cao.jpg">;extra', 'Básico',
+                                            [';'], duplicates='skip')
+        self.assertEqual(relatorio.would_add, 2)
+        self.assertEqual(relatorio.skipped_lines, [1])
+        self.assertEqual(relatorio.field_mismatches, [(2, 3, 2)])
+        self.assertEqual(relatorio.missing_media, [(2, 'cao.jpg')])
+        self.assertEqual(col.notes.keys(), {1})  # Nada foi gravado
+
+
+if __name__ == '__main__':
+    unittest.main()
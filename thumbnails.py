@@ -0,0 +1,231 @@
+# thumbnails.py
+
+"""Miniaturas persistentes das imagens usadas na pré-visualização.
+
+Fotos de câmera arrastadas para o editor têm milhares de pixels de lado e
+eram decodificadas inteiras a cada pré-visualização. Aqui cada imagem
+grande ganha uma miniatura (WebP, ou JPEG se o Qt não gravar WebP) com no
+máximo THUMB_SIZE pixels de lado, gerada numa thread de fundo e guardada
+numa pasta do perfil. O nome do arquivo é o hash do conteúdo e o tamanho,
+então a miniatura sobrevive a renomeações e entre sessões, e um arquivo
+alterado gera outra.
+
+Enquanto a miniatura não fica pronta, a imagem aparece como um espaço
+reservado com a marca `pending_marker(path)`; quando fica, `ready` é
+emitido e quem mostra a pré-visualização descarta do cache só o HTML com
+essa marca e refaz o card atual se ele estiver entre eles. O arquivo original só é carregado sob demanda (clique na imagem).
+"""
+
+import logging
+import os
+import re
+import urllib.parse
+from hashlib import sha1
+
+from aqt import mw
+from aqt.qt import QColor, QImage, QImageReader, QImageWriter, QObject, QPainter, Qt, QUrl, pyqtSignal
+
+# Lado máximo da miniatura, em pixels (também o tamanho do gerenciador de mídia)
+THUMB_SIZE = 600
+THUMB_QUALITY = 80
+# Imagens menores que isto (bytes) são usadas como estão
+THUMB_MIN_BYTES = 256 * 1024
+# Limite da pasta de miniaturas; as menos usadas recentemente saem primeiro
+THUMB_DISK_LIMIT = 200 * 1024 * 1024
+THUMB_FOLDER = 'delimitadores_miniaturas'
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# <img src="..."> depois do link_media (nome relativo à pasta de mídia, já em URL)
+_IMG_TAG = re.compile(r'<img src="([^"]+)"')
+# GIF transparente de 1 pixel: espaço reservado enquanto a miniatura é gerada
+_PLACEHOLDER = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+
+
+def pending_marker(path):
+    """Marca do espaço reservado de `path` no HTML (e no JSON) gerado enquanto a miniatura não existe."""
+    return f"miniatura-{sha1(path.encode('utf-8')).hexdigest()[:16]}"
+
+
+def thumbnail_format():
+    """'webp' se o Qt souber gravar WebP, senão 'jpg'."""
+    return 'webp' if b'webp' in QImageWriter.supportedImageFormats() else 'jpg'
+
+
+def make_thumbnail(path, destino, tamanho=THUMB_SIZE):
+    """Grava a miniatura de `path` em `destino`; False se a imagem não puder ser lida.
+
+    A decodificação já é feita na escala final (QImageReader.setScaledSize),
+    sem carregar a foto inteira na memória.
+    """
+    leitor = QImageReader(path)
+    leitor.setAutoTransform(True)  # Orientação EXIF das fotos de câmera
+    original = leitor.size()
+    if original.isValid() and max(original.width(), original.height()) > tamanho:
+        leitor.setScaledSize(original.scaled(tamanho, tamanho, Qt.AspectRatioMode.KeepAspectRatio))
+    imagem = leitor.read()
+    if imagem.isNull():
+        return False
+    formato = os.path.splitext(destino)[1][1:]
+    if formato == 'jpg' and imagem.hasAlphaChannel():
+        # JPEG não tem transparência: compõe sobre fundo branco
+        fundo = QImage(imagem.size(), QImage.Format.Format_RGB32)
+        fundo.fill(QColor('white'))
+        pintor = QPainter(fundo)
+        pintor.drawImage(0, 0, imagem)
+        pintor.end()
+        imagem = fundo
+    temporario = destino + '.tmp'
+    if not imagem.save(temporario, formato.upper(), THUMB_QUALITY):
+        return False
+    os.replace(temporario, destino)
+    return True
+
+
+def content_hash(path):
+    sha = sha1()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+class ThumbnailCache(QObject):
+    # Caminho da imagem original cuja miniatura ficou pronta
+    ready = pyqtSignal(str)
+
+    def __init__(self, pasta, tamanho=THUMB_SIZE, parent=None):
+        super().__init__(parent)
+        self.pasta = pasta
+        self.tamanho = tamanho
+        self.formato = thumbnail_format()
+        os.makedirs(pasta, exist_ok=True)
+        # (caminho, mtime, tamanho do arquivo) -> arquivo a mostrar (miniatura ou o próprio original)
+        self._prontas = {}
+        self._pendentes = {}  # Mesma chave -> callbacks à espera da thread de fundo
+        mw.taskman.run_in_background(self.prune, self._on_pruned)
+
+    def lookup(self, path):
+        """Arquivo a mostrar no lugar de `path`, ou None se a miniatura ainda está sendo gerada."""
+        try:
+            info = os.stat(path)
+        except OSError:
+            return path  # Ausente: o navegador mostra o erro de sempre
+        chave = (path, info.st_mtime_ns, info.st_size)
+        resultado = self._prontas.get(chave)
+        if resultado is None:
+            if info.st_size < THUMB_MIN_BYTES:
+                resultado = self._prontas[chave] = path
+            else:
+                self._start(chave, path)
+        return resultado
+
+    def request(self, path, callback):
+        """Chama callback(arquivo) na thread principal quando a miniatura estiver disponível."""
+        resultado = self.lookup(path)
+        if resultado is not None:
+            callback(resultado)
+            return
+        try:
+            info = os.stat(path)
+        except OSError:
+            callback(path)
+            return
+        self._start((path, info.st_mtime_ns, info.st_size), path, callback)
+
+    def _start(self, chave, path, callback=None):
+        callbacks = self._pendentes.get(chave)
+        if callbacks is None:
+            callbacks = self._pendentes[chave] = []
+            mw.taskman.run_in_background(lambda: self._generate(path),
+                                         lambda futuro: self._done(chave, path, futuro))
+        if callback is not None:
+            callbacks.append(callback)
+
+    def _generate(self, path):
+        """Thread de fundo: reaproveita a miniatura do disco ou gera uma nova."""
+        destino = os.path.join(self.pasta, f"{content_hash(path)}_{self.tamanho}.{self.formato}")
+        if os.path.exists(destino):
+            os.utime(destino)  # Marca como usada (ver prune)
+            return destino
+        return destino if make_thumbnail(path, destino, self.tamanho) else path
+
+    def _done(self, chave, path, futuro):
+        try:
+            resultado = futuro.result()
+        except Exception as e:
+            logging.error(f"Erro ao gerar a miniatura de {path}: {str(e)}")
+            resultado = path
+        self._prontas[chave] = resultado
+        for callback in self._pendentes.pop(chave, ()):
+            callback(resultado)
+        self.ready.emit(path)
+
+    def prune(self, limite=THUMB_DISK_LIMIT):
+        """Apaga as miniaturas menos usadas até a pasta caber no limite; retorna quantas saíram."""
+        arquivos = []
+        for entrada in os.scandir(self.pasta):
+            if entrada.is_file():
+                info = entrada.stat()
+                arquivos.append((info.st_mtime, info.st_size, entrada.path))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        removidos = 0
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= limite:
+                break
+            os.remove(caminho)
+            total -= tamanho
+            removidos += 1
+        return removidos
+
+    def _on_pruned(self, futuro):
+        try:
+            removidos = futuro.result()
+        except Exception as e:
+            logging.error(f"Erro ao limpar as miniaturas: {str(e)}")
+            return
+        if removidos:
+            logging.debug(f"{removidos} miniaturas antigas removidas de {self.pasta}")
+
+
+_cache = None
+
+
+def thumbnail_cache():
+    """Cache de miniaturas do perfil aberto (criado no primeiro uso)."""
+    global _cache
+    pasta = os.path.join(mw.pm.profileFolder(), THUMB_FOLDER)
+    if _cache is None or _cache.pasta != pasta:
+        _cache = ThumbnailCache(pasta)
+    return _cache
+
+
+def thumbnail_media(html, media_dir):
+    """Troca as imagens grandes do HTML (já passado pelo link_media) pelas miniaturas.
+
+    O original fica em data-full e é carregado ao clicar na imagem.
+    """
+    if '<img src="' not in html:
+        return html
+    cache = thumbnail_cache()
+
+    def substituir(match):
+        src = match.group(1)
+        if ':' in src:
+            return match.group(0)  # data:, http: ou file: já resolvidos
+        nome = urllib.parse.unquote(src)
+        if os.path.splitext(nome)[1].lower() not in IMAGE_EXTENSIONS:
+            return match.group(0)
+        caminho = os.path.join(media_dir, nome)
+        miniatura = cache.lookup(caminho)
+        if miniatura == caminho:
+            return match.group(0)
+        original = (f'data-full="{src}" title="Clique para ver o original" '
+                    'onclick="this.src=this.dataset.full;this.onclick=null"')
+        if miniatura is None:
+            # A marca permite descartar do cache só o HTML com este espaço reservado (ver pending_marker)
+            return (f'<img src="{_PLACEHOLDER}" style="width:160px;height:120px;background:#eee" '
+                    f'data-pending="{pending_marker(caminho)}" {original}')
+        return f'<img src="{QUrl.fromLocalFile(miniatura).toString()}" {original}'
+
+    return _IMG_TAG.sub(substituir, html)
@@ -3,4 +3,7 @@
 import os
 
 # Caminho para o arquivo de configuração
-CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'config.json')
\ No newline at end of file
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'config.json')
+
+# Registro das linhas já importadas (user_files é preservado nas atualizações)
+LEDGER_FILE = os.path.join(os.path.dirname(__file__), 'user_files', 'import_ledger.sqlite')
\ No newline at end of file
@@ -1,21 +1,156 @@
 # visualizar.py
 
-import os
-import re
-import base64
 from aqt import mw
 from aqt.qt import *
 from aqt.utils import showWarning, showInfo
 from aqt.webview import QWebEngineView
+from .cache import LRUCache
+from .render import card_table_html
+from .media_cache import link_media
+from .thumbnails import pending_marker, thumbnail_cache, thumbnail_media
+
+# Cards analisados por vez, conforme a lista é rolada
+FETCH_BATCH = 500
+# Cards vizinhos do selecionado renderizados antecipadamente
+PREFETCH = 2
+# Limite do cache de HTML dos cards, em caracteres
+VIEWER_CACHE_SIZE = 4 * 1024 * 1024
+
+
+def _first_row_at_or_after(cards, numero):
+    """Primeira posição em `cards` (ordenados pela linha) com line_number >= numero."""
+    baixo, alto = 0, len(cards)
+    while baixo < alto:
+        meio = (baixo + alto) // 2
+        if cards[meio].line_number < numero:
+            baixo = meio + 1
+        else:
+            alto = meio
+    return baixo
+
+
+class CardListModel(QAbstractListModel):
+    """Lista de cards do rascunho, analisada aos poucos (canFetchMore/fetchMore).
+
+    Guarda só os ParsedCard (referências às linhas); o HTML é gerado pelo
+    VisualizarCards para o card selecionado. Edições no rascunho chegam por
+    apply_change e mexem só nas linhas afetadas.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cards = []
+        self.plan = None
+        self.linhas = []
+        self.linhas_tags = []
+        self._proxima = 0  # Próxima linha ainda não analisada
+
+    def reset(self, plan, linhas, linhas_tags):
+        self.beginResetModel()
+        self.cards = []
+        self.plan = plan
+        self.linhas = linhas if plan is not None else []
+        self.linhas_tags = linhas_tags
+        self._proxima = 0
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.cards)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return f"Card {index.row() + 1}"
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._proxima < len(self.linhas)
+
+    def _parse_range(self, inicio, fim, card_index):
+        """Cards das linhas [inicio, fim), numerados a partir de card_index."""
+        tags = self.linhas_tags
+        novos = []
+        for n in range(inicio, fim):
+            card = self.plan.parse_line(self.linhas[n], n, card_index + len(novos), tags[n] if n < len(tags) else '')
+            if card is not None:
+                novos.append(card)
+        return novos
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        novos = []
+        while len(novos) < FETCH_BATCH and self._proxima < len(self.linhas):
+            fim = min(len(self.linhas), self._proxima + FETCH_BATCH - len(novos))
+            novos += self._parse_range(self._proxima, fim, len(self.cards) + len(novos))
+            self._proxima = fim
+        if novos:
+            inicio = len(self.cards)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(novos) - 1)
+            self.cards.extend(novos)
+            self.endInsertRows()
+
+    def apply_change(self, primeira, removidas, novas_linhas, novas_tags):
+        """As linhas [primeira, primeira + removidas) viraram `novas_linhas`.
+
+        Só as linhas da lista ligadas a esse trecho são trocadas, removidas ou
+        inseridas; as seguintes apenas têm o número da linha deslocado.
+        """
+        if self.plan is None:
+            return
+        adicionadas = len(novas_linhas)
+        deslocamento = adicionadas - removidas
+        fim_antigo = primeira + removidas
+        self.linhas[primeira:fim_antigo] = novas_linhas
+        if len(self.linhas_tags) < fim_antigo:
+            self.linhas_tags.extend([''] * (fim_antigo - len(self.linhas_tags)))
+        self.linhas_tags[primeira:fim_antigo] = novas_tags
+
+        if primeira >= self._proxima:
+            return  # Trecho ainda não analisado: fetchMore verá o texto novo
+        if self._proxima < fim_antigo:
+            self._proxima = fim_antigo
+        self._proxima += deslocamento
+
+        r0 = _first_row_at_or_after(self.cards, primeira)
+        r1 = _first_row_at_or_after(self.cards, fim_antigo)
+        novos = self._parse_range(primeira, primeira + adicionadas, r0)
+        for card in self.cards[r1:]:
+            card.line_number += deslocamento
+
+        comuns = min(r1 - r0, len(novos))
+        self.cards[r0:r0 + comuns] = novos[:comuns]
+        if r1 - r0 > comuns:
+            self.beginRemoveRows(QModelIndex(), r0 + comuns, r1 - 1)
+            del self.cards[r0 + comuns:r1]
+            self.endRemoveRows()
+        elif len(novos) > comuns:
+            self.beginInsertRows(QModelIndex(), r0 + comuns, r0 + len(novos) - 1)
+            self.cards[r0 + comuns:r0 + comuns] = novos[comuns:]
+            self.endInsertRows()
+        if comuns:
+            self.dataChanged.emit(self.index(r0), self.index(r0 + comuns - 1))
+        if len(novos) != r1 - r0:
+            # A posição dos cards seguintes mudou
+            for row in range(r0 + len(novos), len(self.cards)):
+                self.cards[row].card_index = row
+
 
 class VisualizarCards(QDialog):
     def __init__(self, parent):
         super().__init__(None, Qt.WindowType.Window | Qt.WindowType.WindowMinimizeButtonHint | Qt.WindowType.WindowCloseButtonHint | Qt.WindowType.WindowMaximizeButtonHint)
         self.parent = parent
-        self.cards_preview_list = []
+        self.card_model = CardListModel(self)  # ParsedCard de cada card; o HTML é gerado ao selecionar
+        self.html_cache = LRUCache(VIEWER_CACHE_SIZE)  # Conteúdo do card -> HTML (ver card_key)
+        self._chave_atual = None  # card_key do card mostrado agora
+        self.plan = None
         self.cards_visible = True  # Estado inicial: lista de cards visível
         self.setup_ui()
         self.view_cards_dialog()
+        # Edições no rascunho atualizam só as linhas afetadas da lista
+        self.parent.lines_changed.connect(self.on_lines_changed)
+        self.parent.plan_changed.connect(self.update_preview)
+        thumbnail_cache().ready.connect(self.on_thumbnail_ready)
 
     def setup_ui(self):
         self.setWindowTitle("Visualizar Cards")
@@ -33,11 +168,13 @@ class VisualizarCards(QDialog):
         self.splitter = QSplitter(Qt.Orientation.Horizontal)
         
         # Lista de cards (Card 1, Card 2, etc.)
-        self.card_list_widget = QListWidget()
-        self.card_list_widget.currentItemChanged.connect(self.update_card_preview)
-        self.card_list_widget.setMaximumWidth(200)  # Tamanho máximo inicial
-        self.card_list_widget.setMinimumWidth(100)  # Tamanho mínimo para evitar colapso total
-        self.splitter.addWidget(self.card_list_widget)
+        self.card_list_view = QListView()
+        self.card_list_view.setModel(self.card_model)
+        self.card_list_view.setUniformItemSizes(True)  # Não mede cada item
+        self.card_list_view.selectionModel().currentChanged.connect(self.update_card_preview)
+        self.card_list_view.setMaximumWidth(200)  # Tamanho máximo inicial
+        self.card_list_view.setMinimumWidth(100)  # Tamanho mínimo para evitar colapso total
+        self.splitter.addWidget(self.card_list_view)
         
         # Área de pré-visualização (frente e verso)
         self.card_preview_webview = QWebEngineView()
@@ -58,138 +195,135 @@ class VisualizarCards(QDialog):
         self.setLayout(main_layout)
 
     def generate_card_previews(self):
-        linhas = self.parent.txt_entrada.toPlainText().strip().split('\n')
-        if not linhas:
-            return []
-        delimitadores = [chk.simbolo for chk in self.parent.chk_delimitadores.values() if chk.isChecked()]
-        if not delimitadores or not self.parent.lista_decks.currentItem() or not self.parent.lista_notetypes.currentItem():
-            return []
-        modelo = mw.col.models.by_name(self.parent.lista_notetypes.currentItem().text())
-        campos = [fld['name'] for fld in modelo['flds']]
-        num_fields = len(campos)
-        
+        """Recomeça a lista de cards do rascunho (só o primeiro bloco é analisado já)."""
+        # Uma entrada por bloco do editor, para acompanhar as edições por número da linha
+        linhas = list(self.parent.draft_text.current().lines())  # Cópia: apply_change altera a lista
+        self.plan = self.parent.current_plan()
+        self.html_cache.clear()
+        self._chave_atual = None
+        if self.plan is None or not self.parent.lista_decks.currentItem():
+            self.card_model.reset(None, [], [])
+            return
+
         # Preparação de tags: sempre usar as tags linha por linha
-        tags_lines = self.parent.txt_tags.toPlainText().strip().splitlines()
-        
-        cards_preview_list = []
-        card_index = 0  # Para numeração de cards
+        tags_lines = list(self.parent.tags_text.current().lines())
+        self.card_model.reset(self.plan, linhas, tags_lines)
+
+    def card_key(self, index):
+        """Chave do HTML do card: conteúdo da linha, etiquetas e (se preciso) a posição."""
+        card = self.card_model.cards[index]
+        return (hash(self.card_model.linhas[card.line_number]), card.tag_ids,
+                index if self.plan.uses_card_index else None)
+
+    def render_card(self, index):
+        """HTML do card na posição `index` da lista (do cache, se já gerado)."""
+        chave = self.card_key(index)
+        card_html = self.html_cache.get(chave)
+        if card_html is not None:
+            return card_html
+        card = self.card_model.cards[index]
+
         media_dir = mw.col.media.dir()
 
-        def get_mime_type(file_name):
-            ext = os.path.splitext(file_name)[1].lower()
-            return {
-                '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
-                '.mp3': 'audio/mpeg', '.wav': 'audio/wav', '.ogg': 'audio/ogg', '.mp4': 'video/mp4',
-                '.webm': 'video/webm'
-            }.get(ext, 'application/octet-stream')
-
-        def replace_media_src(match, media_type="img"):
-            file_name = match.group(1)
-            full_path = os.path.join(media_dir, file_name)
-            if not os.path.exists(full_path):
-                print(f"Arquivo não encontrado: {full_path}")
-                return match.group(0)
-            try:
-                with open(full_path, 'rb') as f:
-                    base64_data = base64.b64encode(f.read()).decode('utf-8')
-                mime_type = get_mime_type(file_name)
-                return f'<{media_type} src="data:{mime_type};base64,{base64_data}"' + (" controls width=\"320\" height=\"240\"" if media_type == "video" else "")
-            except Exception as e:
-                print(f"Erro ao codificar {media_type} em base64: {str(e)}")
-                return match.group(0)
-        
-        for i, linha in enumerate(linhas):
-            if not linha.strip():
-                continue
-                
-            # Usar a linha específica de tags para este card
-            tags_for_card = []
-            if i < len(tags_lines):
-                tags_for_card = [tag.strip() for tag in tags_lines[i].split(',') if tag.strip()]
-            
-            # Remover números das tags se necessário
-            tags_for_card = [tag.strip().rstrip('0123456789') for tag in tags_for_card if tag.strip()]
-            
-            for delim in delimitadores:
-                if delim in linha:
-                    partes = linha.split(delim)
-                    card_html = """
-                    <html><body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 10px;">
-                    <table style="width: 100%; border-collapse: separate; border-spacing: 0; box-shadow: 0 4px 8px rgba(0,0,0,0.1); border-radius: 8px; margin-bottom: 20px;">
-                    """
-                    for j, campo in enumerate(partes[:num_fields]):  # Limita ao número de campos do tipo de nota
-                        campo_formatado = campo.strip().replace('\n', '<br>')
-                        for tag, type_ in [('<img', 'img'), ('<source', 'source'), ('<video', 'video')]:
-                            if tag in campo_formatado:
-                                campo_formatado = re.sub(rf'{tag} src="([^"]+)"', lambda m: replace_media_src(m, type_), campo_formatado)
-                        card_html += f"""
-                        <tr><td style="background-color: #444; color: white; padding: 12px; text-align: center; font-weight: bold; font-size: 16px; border-top-left-radius: 8px; border-top-right-radius: 8px;">{campos[j]}</td></tr>
-                        <tr><td style="padding: 15px; border: 1px solid #ddd; background-color: white; border-bottom-left-radius: 8px; border-bottom-right-radius: 8px;">{campo_formatado}</td></tr>
-                        """
-                    card_html += "</table>"
-                    
-                    # Adicionar as tags ao HTML
-                    if tags_for_card:
-                        if self.parent.chk_num_tags.isChecked():
-                            # Adicionar número ao final de cada tag baseado no índice do card
-                            tags_str = ', '.join(f"{tag}{card_index + 1}" for tag in tags_for_card)
-                        else:
-                            # Usar tags sem numeração
-                            tags_str = ', '.join(tags_for_card)
-                        
-                        card_html += f"<p><b>Tags:</b> {tags_str}</p>"
-                    
-                    card_html += "</body></html>"
-                    cards_preview_list.append(card_html)
-                    card_index += 1
-                    break
-                    
-        return cards_preview_list
+        def link_media_br(campo_formatado):
+            return thumbnail_media(link_media(campo_formatado.replace('\n', '<br>')), media_dir)
+
+        card_html = card_table_html(self.plan, card, self.card_model.linhas[card.line_number], index,
+                                    media_transform=link_media_br)
+        card_html = f"""
+        <html><body style="font-family: Arial, sans-serif; background-color: #f9f9f9; padding: 10px;">
+        {card_html}
+        </body></html>"""
+        return self.html_cache.put(chave, card_html)
+
+    def prefetch(self, index):
+        """Gera antes o HTML dos vizinhos do card selecionado."""
+        total = len(self.card_model.cards)
+        for vizinho in range(max(0, index - PREFETCH), min(total, index + PREFETCH + 1)):
+            if self.card_key(vizinho) not in self.html_cache:
+                self.render_card(vizinho)
+
+    def on_lines_changed(self, primeira, removidas, adicionadas):
+        """Aplica uma edição do rascunho à lista e redesenha só o card atual, se ele mudou."""
+        if self.plan is None:
+            return
+        entrada = self.parent.txt_entrada.document()
+        tags = self.parent.txt_tags.document()
+        novas_linhas = [entrada.findBlockByNumber(n).text() for n in range(primeira, primeira + adicionadas)]
+        novas_tags = []
+        for n in range(primeira, primeira + adicionadas):
+            bloco = tags.findBlockByNumber(n)
+            novas_tags.append(bloco.text() if bloco.isValid() else '')
+        self.card_model.apply_change(primeira, removidas, novas_linhas, novas_tags)
+
+        atual = self.card_list_view.currentIndex()
+        if atual.isValid() and self.card_key(atual.row()) != self._chave_atual:
+            self.show_card(atual.row())
+
+    def on_thumbnail_ready(self, path):
+        """Miniatura nova: descarta o HTML com o espaço reservado dela e refaz o card atual, se for um deles."""
+        marca = pending_marker(path)
+        removidas = self.html_cache.discard_where(lambda chave, card_html: marca in card_html)
+        atual = self.card_list_view.currentIndex()
+        if atual.isValid() and self._chave_atual in removidas:
+            self.show_card(atual.row())
+
+    def show_card(self, index):
+        self._chave_atual = self.card_key(index)
+        self.card_preview_webview.setHtml(self.render_card(index), self.parent.media_base_url())
 
     def view_cards_dialog(self):
-        linhas = self.parent.txt_entrada.toPlainText().strip().split('\n')
-        delimitadores = [chk.simbolo for chk in self.parent.chk_delimitadores.values() if chk.isChecked()]
-        if not linhas or not delimitadores or not self.parent.lista_decks.currentItem() or not self.parent.lista_notetypes.currentItem():
+        if self.parent.still_loading():
+            return
+        texto = self.parent.draft_text.current().text
+        if not texto or texto.isspace() or self.parent.current_plan() is None or not self.parent.lista_decks.currentItem():
             showWarning("Digite conteúdo, selecione um delimitador, deck e modelo para visualizar!")
             return
-        self.cards_preview_list = self.generate_card_previews()
-        if not self.cards_preview_list:
+        self.generate_card_previews()
+        if not self.card_model.rowCount():
             showWarning("Nenhum card válido para visualizar!")
             return
-        self.card_list_widget.addItems([f"Card {i+1}" for i in range(len(self.cards_preview_list))])
-        if self.cards_preview_list:
-            self.card_list_widget.setCurrentRow(0)
+        self.card_list_view.setCurrentIndex(self.card_model.index(0))
 
     def update_card_preview(self, current, previous):
-        if current:  # Atualiza a pré-visualização apenas se houver um item selecionado
-            index = self.card_list_widget.row(current)
-            if index < len(self.cards_preview_list):
-                self.card_preview_webview.setHtml(self.cards_preview_list[index])
+        if current.isValid():  # Atualiza a pré-visualização apenas se houver um item selecionado
+            index = current.row()
+            if index < len(self.card_model.cards):
+                self.show_card(index)
                 self.card_preview_webview.page().runJavaScript("""
                     document.body.style.transition = 'background-color 0.5s';
                     document.body.style.backgroundColor = '#fff9e6';
                     setTimeout(() => document.body.style.backgroundColor = '#f9f9f9', 500);
                 """)
+                # Vizinhos depois que o card atual já foi mostrado
+                QTimer.singleShot(0, lambda: self.prefetch(index))
         else:
+            self._chave_atual = None
             self.card_preview_webview.setHtml("")  # Limpa a pré-visualização se não houver seleção
 
+    def closeEvent(self, event):
+        self.parent.lines_changed.disconnect(self.on_lines_changed)
+        self.parent.plan_changed.disconnect(self.update_preview)
+        thumbnail_cache().ready.disconnect(self.on_thumbnail_ready)
+        super().closeEvent(event)
+
     def toggle_cards_visibility(self):
         self.cards_visible = not self.cards_visible
         self.toggle_cards_button.setText("Mostrar Cards" if not self.cards_visible else "Ocultar Cards")
-        self.card_list_widget.setVisible(self.cards_visible)
+        self.card_list_view.setVisible(self.cards_visible)
         # Não limpa a pré-visualização, apenas oculta/mostra a lista lateral
 
     def update_preview(self):
         # Atualiza a lista de cards e a pré-visualização quando há qualquer alteração
-        self.cards_preview_list = self.generate_card_previews()
-        current_row = self.card_list_widget.currentRow()
-        self.card_list_widget.clear()
-        if self.cards_preview_list:
-            self.card_list_widget.addItems([f"Card {i+1}" for i in range(len(self.cards_preview_list))])
-            # Tenta manter o mesmo card selecionado, se possível
-            if current_row >= 0 and current_row < len(self.cards_preview_list):
-                self.card_list_widget.setCurrentRow(current_row)
+        current_row = self.card_list_view.currentIndex().row()
+        self.generate_card_previews()
+        if self.card_model.rowCount():
+            # Tenta manter o mesmo card selecionado, se possível (analisando até ele)
+            while current_row >= self.card_model.rowCount() and self.card_model.canFetchMore(QModelIndex()):
+                self.card_model.fetchMore(QModelIndex())
+            if 0 <= current_row < self.card_model.rowCount():
+                self.card_list_view.setCurrentIndex(self.card_model.index(current_row))
             else:
-                self.card_list_widget.setCurrentRow(0)  # Seleciona o primeiro card se a posição anterior não for válida
+                self.card_list_view.setCurrentIndex(self.card_model.index(0))  # Seleciona o primeiro card se a posição anterior não for válida
         else:
-            self.card_preview_webview.setHtml("")  # Limpa a pré-visualização se não houver cards
\ No newline at end of file
+            self.card_preview_webview.setHtml("")  # Limpa a pré-visualização se não houver cards